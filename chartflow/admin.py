@@ -10,9 +10,12 @@ admin.site.register(
     search_fields = ("name",)
 )
 admin.site.register(models.Chart)
+admin.site.register(models.ChartGeneration)
 admin.site.register(models.ChartEntry)
+admin.site.register(models.ChartSnapshot)
 admin.site.register(models.Country)
 admin.site.register(models.CountryCluster)
+admin.site.register(models.ExportPotential)
 admin.site.register(
     models.User, 
     UserAdmin, 
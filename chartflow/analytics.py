@@ -0,0 +1,163 @@
+"""Process-local artist x country rank matrix for the analytics endpoints.
+
+The current charts fit in a few megabytes once projected on a dense
+artists x countries grid, so the analytics questions become NumPy indexing
+instead of joins over ChartEntry. The matrix is built from one query and
+rebuilt the first time it is read after the data version changed."""
+import threading
+from functools import cached_property
+
+import numpy as np
+from django.conf import settings
+
+from . import cache
+from .exports import group_by_country
+from .models import ChartEntry
+
+# Ranks are 1-based, 0 marks an artist absent from a chart
+absent = 0
+
+
+class RankMatrix:
+    def __init__(self, version: int, entries):
+        """`entries` are (entry id, artist id, country, rank, nationality, artist name) rows."""
+        self.version = version
+        entry_ids, artist_ids, countries, ranks, nationalities, names = list(zip(*entries)) or [()] * 6
+
+        # Dense index maps: row i is artist self.artist_ids[i], column j is
+        # country self.countries[j]; countries are sorted like the ORM orders them
+        self.artist_ids, first, rows = np.unique(np.array(artist_ids, dtype=np.int64), return_index=True, return_inverse=True)
+        self.countries, columns = np.unique(np.array(countries, dtype='U2'), return_inverse=True)
+        self.artist_index = {int(artist_id): row for row, artist_id in enumerate(self.artist_ids)}
+        self.country_index = {str(country): column for column, country in enumerate(self.countries)}
+        self.nationalities = np.array(nationalities, dtype='U2')[first]
+        self.names = np.array(names, dtype=str)[first]
+
+        shape = (len(self.artist_ids), len(self.countries))
+        self.ranks = np.zeros(shape, dtype=np.int16)
+        self.ranks[rows, columns] = ranks
+        self.entry_ids = np.zeros(shape, dtype=np.int64)
+        self.entry_ids[rows, columns] = entry_ids
+
+    @classmethod
+    def build(cls, version: int) -> 'RankMatrix':
+        return cls(version, ChartEntry.objects.current().values_list(
+            'id', 'artist_id', 'chart__country', 'rank', 'artist__nationality', 'artist__name'
+        ))
+
+    def nationality_rows(self, nationality: str) -> np.ndarray:
+        return np.flatnonzero(self.nationalities == nationality)
+
+    def best_ranks(self, nationality: str) -> dict[str, int]:
+        """Best rank reached in each country by an artist of `nationality`."""
+        ranks = self.ranks[self.nationality_rows(nationality)]
+        # Absent cells sort after every rank
+        best = np.where(ranks == absent, np.iinfo(np.int16).max, ranks).min(axis=0, initial=np.iinfo(np.int16).max)
+        charted = np.flatnonzero(best != np.iinfo(np.int16).max)
+        return dict(zip(self.countries[charted].tolist(), best[charted].tolist()))
+
+    def present_columns(self, artist_id: int) -> np.ndarray:
+        if (row := self.artist_index.get(artist_id)) is None:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self.ranks[row])
+
+    def absent_countries(self, artist_id: int) -> list[str]:
+        """Countries whose current chart does not list the artist."""
+        return np.delete(self.countries, self.present_columns(artist_id)).tolist()
+
+    def artist_entries(self, artist_id: int) -> list[tuple[int, str, int]]:
+        """(entry id, country, rank) of the artist's current entries, by entry id."""
+        columns = self.present_columns(artist_id)
+        if not len(columns):
+            return []
+        row = self.artist_index[artist_id]
+        entry_ids = self.entry_ids[row, columns]
+        order = np.argsort(entry_ids)
+        return list(zip(
+            entry_ids[order].tolist(), self.countries[columns[order]].tolist(), self.ranks[row, columns[order]].tolist()
+        ))
+
+    def export_potential(self, artist_id: int, nationality: str) -> list[dict]:
+        """Same payload as `exports.live_export_potential`."""
+        rows = self.nationality_rows(nationality)
+        rows = rows[self.artist_ids[rows] != artist_id]
+        columns = np.ones(len(self.countries), dtype=bool)
+        columns[self.present_columns(artist_id)] = False
+        if (own := self.country_index.get(nationality)) is not None:
+            columns[own] = False
+        columns = np.flatnonzero(columns)
+
+        ranks = self.ranks[np.ix_(rows, columns)]
+        cell_rows, cell_columns = np.nonzero(ranks)
+        names = self.names[rows[cell_rows]]
+        cell_ranks = ranks[cell_rows, cell_columns]
+        # Sorted by country, then rank, then name (lexsort keys are given last first)
+        order = np.lexsort((names, cell_ranks, cell_columns))
+        return group_by_country(zip(
+            self.countries[columns[cell_columns[order]]].tolist(), names[order].tolist(), cell_ranks[order].tolist()
+        ))
+
+    @cached_property
+    def country_similarity(self) -> np.ndarray:
+        """Cosine similarity of every pair of countries, as a countries x
+        countries array.
+
+        Each country is a vector over artists weighted by rank (1 / log2(rank + 1),
+        so a number one counts about three times a number seven). The product
+        of that sparse countries x artists matrix with its transpose only visits
+        the pairs of cells sharing an artist, so its cost grows with the number
+        of entries rather than with the size of the dense grid."""
+        rows, columns = np.nonzero(self.ranks)  # row-major: the cells of an artist are contiguous
+        weights = 1 / np.log2(self.ranks[rows, columns] + 1)
+
+        # Pair every cell with every cell of the same artist
+        per_artist = np.bincount(rows, minlength=len(self.artist_ids))
+        sizes = per_artist[rows]
+        left = np.repeat(np.arange(len(rows)), sizes)
+        first_cell = (np.cumsum(per_artist) - per_artist)[rows]
+        right = np.repeat(first_cell, sizes) + np.arange(len(left)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+        n = len(self.countries)
+        products = np.bincount(
+            columns[left] * n + columns[right], weights=weights[left] * weights[right], minlength=n * n
+        ).reshape(n, n)
+        norms = np.sqrt(np.diag(products))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.nan_to_num(products / np.outer(norms, norms))
+
+    def similar_countries(self, country: str, k: int) -> list[dict]:
+        """The `k` countries whose charts overlap the most with `country`'s."""
+        if (column := self.country_index.get(country)) is None:
+            return []
+        similarity = self.country_similarity[column]
+        others = np.delete(np.arange(len(self.countries)), column)
+        # Stable sort by descending similarity, ties by country code
+        order = others[np.argsort(-similarity[others], kind='stable')][:k]
+        return [
+            {'country': code, 'similarity': round(value, 4)}
+            for code, value in zip(self.countries[order].tolist(), similarity[order].tolist())
+        ]
+
+
+_matrix = None
+_lock = threading.Lock()
+
+
+def rank_matrix() -> RankMatrix:
+    """The matrix of the current data version, rebuilt when the version moved."""
+    global _matrix
+    version = cache.data_version()
+    if _matrix is None or _matrix.version != version:
+        with _lock:
+            if _matrix is None or _matrix.version != version:
+                _matrix = RankMatrix.build(version)
+    return _matrix
+
+
+def clear():
+    global _matrix
+    _matrix = None
+
+
+def matrix_backend() -> bool:
+    return getattr(settings, 'CHARTFLOW_ANALYTICS_BACKEND', 'orm') == 'matrix'
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class StartrackConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chartflow'
+
+    def ready(self):
+        from . import cache, exports
+        cache.connect()
+        exports.connect()
@@ -0,0 +1,287 @@
+"""Native async views, served without a thread per request under ASGI
+(ddd_backend/asgi.py). Under WSGI Django runs them in an event loop of
+their own, so they still work but gain nothing."""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Subquery
+from django.forms import ModelChoiceField, ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django_filters.utils import translate_validation
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated, NotFound, PermissionDenied
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.request import Request
+
+from .analytics import matrix_backend, rank_matrix
+from .authentication import StatelessJWTAuthentication, login_payload
+from .exports import group_by_country, stored_export_potential_rows
+from .filters import ChartEntryFilter, ChartFilter, EntryFilter
+from .hashing import PoolSaturated, hashing_pool
+from .models import Artist, Chart, ChartEntry, Country, CountryCluster, User
+from .pagination import IdCursorPagination
+from .permissions import (
+    ArtistViewPermissions, ChartEntryViewPermissions, ChartViewPermissions, CountryClusterViewPermissions,
+    CountryViewPermissions, caller_scope,
+)
+from .readers import ChartEntryReader, ChartReader, artist as artist_data, country, read_snapshot
+from .renderers import FastJSONRenderer, fragment_packer
+from .replica import replica_reads
+
+
+def error_response(message, status=400, **kwargs):
+    # Same body as the DRF views' {'error': ValidationError(message)}
+    return JsonResponse({'error': [message]}, status=status, **kwargs)
+
+
+@csrf_exempt
+@require_POST
+async def authenticate(request):
+    """Async twin of `UserViewSet.authenticate`: the password is checked on
+    the hashing pool, the token pair is issued in a worker thread."""
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+    except ValueError:
+        return error_response("Invalid JSON body")
+    if not hasattr(data, 'get'):
+        return error_response("Invalid credentials")
+
+    email, password = data.get('email'), data.get('password')
+    if not isinstance(email, str) or not isinstance(password, str):
+        # The hashers only take strings
+        return error_response("Invalid credentials")
+    user = await User.objects.filter(email=email).afirst() if email else None
+    try:
+        valid = await hashing_pool().verify(user, password)
+    except PoolSaturated:
+        return error_response("Too many logins in progress, retry shortly", status=503, headers={'Retry-After': '1'})
+    if not valid:
+        return error_response("Invalid credentials")
+    return JsonResponse(await sync_to_async(login_payload)(user))
+
+
+# Read API. Each view mirrors the payload, filters, pagination and permissions
+# of the DRF endpoint of the same path without the `async/` prefix, served
+# from the values() readers. They skip the response cache and the
+# conditional GET of the sync views.
+#
+# Queries that do not depend on each other are awaited together. With the
+# async ORM of Django 5.2 they still reach SQLite one after the other, on the
+# thread the ORM calls are handed to; what the event loop gains is that no
+# request holds a worker thread while it waits for them.
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def filter_queryset(filterset_class, request, queryset):
+    """The filterset's queryset, or DjangoFilterBackend's 400 when invalid."""
+    filterset = filterset_class(request.query_params, queryset=queryset, request=request)
+    # Model choice filters validate their value with a query
+    lookups = any(
+        isinstance(field, ModelChoiceField) for name, field in filterset.form.fields.items() if name in request.query_params
+    )
+    if not (await sync_to_async(filterset.is_valid)() if lookups else filterset.is_valid()):
+        raise translate_validation(filterset.errors)
+    return filterset.qs
+
+
+class AsyncReadView(View):
+    """GET on a list (`list`) or an object (`retrieve`), authenticated and
+    authorized like the DRF viewset it mirrors."""
+    http_method_names = ['get']
+    permission_classes = (IsAuthenticated,)
+    action = None
+    # Read from the replica, like the DRF viewsets with ReplicaReadMixin
+    replica = True
+
+    async def get(self, request, pk=None):
+        if not self.replica:
+            return await self.respond(request, pk)
+        with replica_reads():
+            return await self.respond(request, pk)
+
+    async def respond(self, request, pk=None):
+        self.action = self.action or ('list' if pk is None else 'retrieve')
+        request = Request(request)
+        try:
+            authenticator = StatelessJWTAuthentication()
+            request.user, request.auth = await authenticator.aauthenticate(request) or (AnonymousUser(), None)
+            await self.check_permissions(request)
+            if self.action == 'list':
+                return json_response(await self.list(request))
+            return json_response(await getattr(self, self.action)(request, pk))
+        except APIException as exc:
+            # Same responses as DRF's exception handler
+            response = json_response(exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}, status=exc.status_code)
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+        except ValidationError as e:
+            return json_response({'error': e.messages}, status=400)
+
+    def permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    async def check_permissions(self, request, obj=None):
+        for permission in self.permissions():
+            if not permission.has_permission(request, self) or (obj is not None and not permission.has_object_permission(request, self, obj)):
+                if not request.user.is_authenticated:
+                    raise NotAuthenticated()
+                raise PermissionDenied(getattr(permission, 'message', None))
+
+    async def check_object_permissions(self, request, obj):
+        await self.check_permissions(request, obj)
+
+    def not_found(self, model):
+        return NotFound(f"No {model._meta.object_name} matches the given query.")
+
+
+class CountryView(AsyncReadView):
+    permission_classes = (IsAuthenticated, IsAdminUser|CountryViewPermissions)
+    columns = ('iso2', 'internet_users', 'population')
+
+    async def list(self, request):
+        pack = fragment_packer()
+        return [pack(country(*row)) async for row in Country.objects.values_list(*self.columns)]
+
+    async def retrieve(self, request, pk):
+        if (row := await Country.objects.filter(pk=pk).values_list(*self.columns).afirst()) is None:
+            raise self.not_found(Country)
+        return country(*row)
+
+
+class CountryClusterView(AsyncReadView):
+    permission_classes = (IsAuthenticated, IsAdminUser|CountryClusterViewPermissions)
+    columns = ('country__iso2', 'country__internet_users', 'country__population', 'cluster')
+
+    def shape(self, row, pack):
+        # CountryClusterSerializer
+        return {'country': pack(country(*row[:3])), 'cluster': row[3]}
+
+    async def list(self, request):
+        pack = fragment_packer()
+        return [self.shape(row, pack) async for row in CountryCluster.objects.values_list(*self.columns)]
+
+    async def retrieve(self, request, pk):
+        if (row := await CountryCluster.objects.filter(pk=pk).values_list(*self.columns).afirst()) is None:
+            raise self.not_found(CountryCluster)
+        return self.shape(row, fragment_packer())
+
+
+class ChartView(AsyncReadView):
+    permission_classes = (IsAuthenticated, IsAdminUser|ChartViewPermissions)
+    reader = ChartReader()
+
+    async def charts(self, request):
+        charts = await filter_queryset(ChartFilter, request, Chart.objects.current().select_related('country'))
+        # Selected by chart id only, like ChartViewSet.get_entries
+        entries = await filter_queryset(EntryFilter, request, ChartEntry.objects.order_by('id'))
+        return self.reader.values(charts), entries
+
+    # The charts and their entries are read in one transaction (read_snapshot),
+    # which the async ORM cannot hold across awaits: both reads are handed to
+    # the ORM thread in a single call instead.
+
+    def read_page(self, request, paginator, charts, entries):
+        with read_snapshot(Chart):
+            rows = paginator.paginate_queryset(charts, request, self)
+            return self.reader.shape(rows, entries=entries)
+
+    def read_chart(self, charts, entries):
+        with read_snapshot(Chart):
+            rows = list(charts[:1])
+            return self.reader.shape(rows, entries=entries)
+
+    async def list(self, request):
+        charts, entries = await self.charts(request)
+        paginator = IdCursorPagination()
+        page = await sync_to_async(self.read_page)(request, paginator, charts, entries)
+        return paginator.get_paginated_response(page).data
+
+    async def retrieve(self, request, pk):
+        charts, entries = await self.charts(request)
+        if not (chart := await sync_to_async(self.read_chart)(charts.filter(pk=pk), entries)):
+            raise self.not_found(Chart)
+        return chart[0]
+
+
+class ChartEntryView(AsyncReadView):
+    permission_classes = (IsAuthenticated, IsAdminUser|ChartEntryViewPermissions)
+    reader = ChartEntryReader()
+
+    async def entries(self, request):
+        queryset = ChartEntry.objects.current().select_related('artist__manager', 'chart__country')
+        return self.reader.values(await filter_queryset(ChartEntryFilter, request, queryset))
+
+    async def list(self, request):
+        paginator = IdCursorPagination()
+        rows = await paginator.apaginate_queryset(await self.entries(request), request, self)
+        return paginator.get_paginated_response(self.reader.shape(rows)).data
+
+    async def retrieve(self, request, pk):
+        if (row := await (await self.entries(request)).filter(pk=pk).afirst()) is None:
+            raise self.not_found(ChartEntry)
+        (entry,) = self.reader.shape([row])
+        return entry
+
+
+class ArtistPerformanceView(AsyncReadView):
+    permission_classes = (IsAuthenticated, IsAdminUser|ArtistViewPermissions)
+    action = 'performance'
+    reader = ChartEntryReader()
+    replica = False
+
+    async def check_object_permissions(self, request, obj):
+        # The scope is memoized on the request, ArtistViewPermissions then reads it without a query
+        await sync_to_async(caller_scope)(request)
+        await super().check_object_permissions(request, obj)
+
+    async def performance(self, request, pk):
+        if matrix_backend():
+            artist = await Artist.objects.select_related('manager').filter(pk=pk).afirst()
+            if artist is None:
+                raise self.not_found(Artist)
+            await self.check_object_permissions(request, artist)
+            data = artist_data(artist.pk, artist.name, artist.manager.username if artist.manager else None, artist.nationality)
+            matrix = await sync_to_async(rank_matrix)()
+            return [{'id': entry_id, 'artist': data, 'rank': rank, 'country': country} for entry_id, country, rank in matrix.artist_entries(artist.pk)]
+
+        # The entries only need the artist id: both queries are sent at once
+        entries = self.reader.values(
+            ChartEntry.objects.current().filter(artist_id=pk).select_related('artist__manager', 'chart__country')
+        )
+        artist, rows = await asyncio.gather(
+            Artist.objects.filter(pk=pk).afirst(), collect(entries),
+        )
+        if artist is None:
+            raise self.not_found(Artist)
+        await self.check_object_permissions(request, artist)
+        return self.reader.shape(rows)
+
+
+class ExportPotentialView(AsyncReadView):
+    action = 'export_potential'
+
+    async def export_potential(self, request, pk):
+        if matrix_backend():
+            if (artist := await Artist.objects.filter(pk=pk).afirst()) is None:
+                raise ValidationError("Artist not found")
+            return (await sync_to_async(rank_matrix)()).export_potential(artist.pk, artist.nationality)
+
+        # The rows read the nationality in a subquery, so they do not wait for the artist
+        nationality = Subquery(Artist.objects.filter(pk=pk).values('nationality'))
+        exists, rows = await asyncio.gather(
+            Artist.objects.filter(pk=pk).aexists(), collect(stored_export_potential_rows(pk, nationality)),
+        )
+        if not exists:
+            raise ValidationError("Artist not found")
+        return group_by_country(rows)
+
+
+async def collect(queryset) -> list:
+    return [row async for row in queryset]
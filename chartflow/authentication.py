@@ -0,0 +1,144 @@
+"""Stateless JWT authentication.
+
+The access tokens issued by `UserViewSet.authenticate` and the refresh view
+carry the claims the permission classes read: role, staff flags, the
+caller's artist profile and the artists they manage. StatelessJWTAuthentication
+rebuilds the request user from those claims instead of loading the User row
+on every request. A role or scope change is therefore seen at the next token
+refresh, at most ACCESS_TOKEN_LIFETIME later, and a deactivated user keeps
+access until their access token expires; their next refresh is refused."""
+import threading
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DEFERRED, F
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .blacklist import blacklist_filter
+from .models import Artist, TokenUser, User
+from .serializers import UserSerializer
+
+user_fields = ('role', 'email', 'username', 'is_staff', 'is_superuser')
+# Larger scopes are left out of the token and resolved from the database
+max_managed_claims = 200
+
+
+def user_claims(user_id) -> dict | None:
+    """Claims describing an active user, None for a missing or inactive one."""
+    claims = User.objects.filter(pk=user_id, is_active=True).values(*user_fields, artist_id=F('artist_profile__id')).first()
+    if claims is None:
+        return None
+    managed = list(Artist.objects.filter(manager_id=user_id).order_by('id').values_list('id', flat=True)[:max_managed_claims + 1])
+    claims['managed_artist_ids'] = managed if len(managed) <= max_managed_claims else None
+    return claims
+
+
+class ScopedRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the user claims, read again
+    from the database every time an access token is issued.
+
+    Its blacklist checks go through chartflow.blacklist, which only queries
+    the blacklist for the tokens it may hold."""
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        if (claims := user_claims(self[api_settings.USER_ID_CLAIM])) is not None:
+            access.payload.update(claims)
+        return access
+
+    def check_blacklist(self):
+        if blacklist_filter.may_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
+
+
+class ScopedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ScopedRefreshToken
+
+
+def login_payload(user) -> dict:
+    """Response of a successful login: a new token pair and the user."""
+    refresh = ScopedRefreshToken.for_user(user)
+    return {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserSerializer(user).data,
+    }
+
+
+def token_user(token) -> TokenUser:
+    """An unsaved-looking User built from the token claims alone: the other
+    fields are deferred, and the artist profile is a stub holding its key."""
+    loaded = {field: token[field] for field in user_fields}
+    loaded.update(id=token[api_settings.USER_ID_CLAIM], is_active=True)
+    fields = TokenUser._meta.concrete_fields
+    user = TokenUser.from_db(DEFAULT_DB_ALIAS, [field.attname for field in fields], [loaded.get(field.attname, DEFERRED) for field in fields])
+
+    artist_id = token.get('artist_id')
+    profile = Artist.from_db(DEFAULT_DB_ALIAS, ['id', 'user_id'], [artist_id, user.pk]) if artist_id is not None else None
+    TokenUser.artist_profile.related.set_cached_value(user, profile)
+    managed = token.get('managed_artist_ids')
+    user.managed_artist_ids = frozenset(managed) if managed is not None else None
+    return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication without the user query, for the tokens carrying the
+    user claims. Older tokens are still authenticated against the database."""
+
+    def get_user(self, validated_token):
+        if 'role' not in validated_token or api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+        return token_user(validated_token)
+
+    async def aauthenticate(self, request):
+        """`authenticate` for the async views: (user, token) or None, with
+        the database only queried for the tokens without claims."""
+        if (header := self.get_header(request)) is None or (raw_token := self.get_raw_token(header)) is None:
+            return None
+        token = self.get_validated_token(raw_token)
+        if 'role' not in token or api_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(super().get_user)(token), token
+        return token_user(token), token
+
+
+# Full users, for the few reads of a field the token does not carry
+
+_users = {}
+_users_lock = threading.Lock()
+max_cached_users = 10_000
+
+
+def user_cache_ttl() -> float:
+    return getattr(settings, 'CHARTFLOW_USER_CACHE_TTL', 60)
+
+
+def cached_user(user_id) -> User:
+    now = monotonic()
+    if (entry := _users.get(user_id)) is not None and entry[0] > now:
+        return entry[1]
+
+    user = User.objects.get(pk=user_id)
+    with _users_lock:
+        if len(_users) >= max_cached_users:
+            for key in [key for key, (expires, _) in _users.items() if expires <= now]:
+                del _users[key]
+            if len(_users) >= max_cached_users:
+                _users.clear()
+        _users[user_id] = (now + user_cache_ttl(), user)
+    return user
+
+
+def clear():
+    with _users_lock:
+        _users.clear()
@@ -0,0 +1,87 @@
+"""In-process filter of the blacklisted refresh tokens.
+
+simplejwt checks the token_blacklist tables on every refresh and logout,
+although nearly every token it sees is not blacklisted. The filter answers
+those checks from memory: a Bloom filter of the blacklisted jtis (JWT ids),
+synced incrementally from BlacklistedToken. A jti it does not hold was not
+blacklisted at the last sync; a jti it may hold is confirmed in the
+database, so a false positive only costs the query the check used to make.
+
+Tokens blacklisted by this process are added at once. Those blacklisted by
+another worker are seen at its next sync, CHARTFLOW_BLACKLIST_SYNC_INTERVAL
+seconds at most; 0 syncs before every check."""
+import math
+import threading
+from hashlib import blake2b
+from time import monotonic
+
+from django.conf import settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+# Rebuilt from the table past this age, so that the rows removed by
+# flushexpiredtokens stop weighing on the error rate
+rebuild_interval = 3600
+min_capacity = 10_000
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key: str):
+        # Double hashing: k positions out of one 128-bit digest
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class BlacklistFilter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = None
+        self.last_id = 0
+        self.synced_at = self.built_at = -math.inf
+
+    def sync_interval(self) -> float:
+        return getattr(settings, 'CHARTFLOW_BLACKLIST_SYNC_INTERVAL', 5)
+
+    def sync(self):
+        now = monotonic()
+        if now - self.synced_at < self.sync_interval() and self.bloom is not None:
+            return
+        with self.lock:
+            if now - self.built_at > rebuild_interval or self.bloom is None or self.bloom.count >= self.bloom.capacity:
+                self.bloom = BloomFilter(max(min_capacity, 2 * BlacklistedToken.objects.count()))
+                self.last_id = 0
+                self.built_at = now
+            rows = BlacklistedToken.objects.filter(id__gt=self.last_id).order_by('id').values_list('id', 'token__jti')
+            for self.last_id, jti in rows:
+                self.bloom.add(jti)
+            self.synced_at = now
+
+    def may_contain(self, jti: str) -> bool:
+        self.sync()
+        return jti in self.bloom
+
+    def add(self, jti: str):
+        self.sync()
+        with self.lock:
+            self.bloom.add(jti)
+
+
+blacklist_filter = BlacklistFilter()
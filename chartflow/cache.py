@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils.crypto import salted_hmac
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Artist, Chart, ChartEntry, ChartGeneration, Country, CountryCluster, DataVersion, User
+
+stats_keys = {'hits': 'chartflow:stats:hits', 'misses': 'chartflow:stats:misses'}
+
+
+def response_cache_alias() -> str:
+    return getattr(settings, 'CHARTFLOW_RESPONSE_CACHE', 'default')
+
+
+def response_cache():
+    return caches[response_cache_alias()]
+
+
+def data_version() -> int:
+    return DataVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def bump_data_version():
+    if not DataVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        DataVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def cache_stats() -> dict:
+    cache = response_cache()
+    stats = {name: cache.get(key, 0) for name, key in stats_keys.items()}
+    stats['version'] = data_version()
+    # Django's default when the cache sets none
+    stats['max_entries'] = settings.CACHES[response_cache_alias()].get('OPTIONS', {}).get('MAX_ENTRIES', 300)
+    return stats
+
+
+def _count(name):
+    cache = response_cache()
+    try:
+        cache.incr(stats_keys[name])
+    except ValueError:
+        cache.add(stats_keys[name], 1, timeout=None)
+
+
+def etag_matches(request, etag) -> bool:
+    """Weak comparison of If-None-Match: compressed responses carry a
+    `-gzip` suffixed (or weakened) variant of the same tag."""
+    if not (header := request.headers.get('If-None-Match')):
+        return False
+    tags = {tag.removeprefix('W/').replace('-gzip"', '"') for tag in parse_etags(header)}
+    return '*' in tags or etag in tags
+
+
+class ConditionalGetMixin:
+    """Strong ETags and If-None-Match handling for `list` and `retrieve`.
+
+    The tag is derived from the data version and the request, so it can be
+    checked before running the view: a matching request gets an empty 304."""
+
+    def get_cache_scope(self, request) -> str:
+        return getattr(request.user, 'role', '') or 'anonymous'
+
+    def get_cache_key(self, request, version) -> str:
+        params = sorted(request.query_params.lists())
+        raw = f"{self.basename}:{self.action}:{sorted(self.kwargs.items())}:{params}:{self.get_cache_scope(request)}"
+        return f"chartflow:response:{version}:{sha1(raw.encode()).hexdigest()}"
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        key = self.get_cache_key(request, data_version())
+        # Keyed with the secret key: a client cannot forge the tag of a
+        # response it was never allowed to read
+        etag = f'"{salted_hmac("chartflow.etag", key).hexdigest()}"'
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = self.build_response(key, handler, request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
+
+    def build_response(self, key, handler, request, *args, **kwargs):
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+
+class UserScopedConditionalGetMixin(ConditionalGetMixin):
+    """For endpoints whose payload depends on the caller, not only its role."""
+
+    def get_cache_scope(self, request) -> str:
+        return f"{super().get_cache_scope(request)}:{request.user.pk}"
+
+
+class CachedResponseMixin(ConditionalGetMixin):
+    """Also serves `list` and `retrieve` from the response cache.
+
+    Entries are keyed by the data version, so any write to the chart data
+    makes every cached response unreachable; the cache backend evicts them
+    once it reaches its MAX_ENTRIES."""
+
+    def build_response(self, key, handler, request, *args, **kwargs):
+        cache = response_cache()
+        if (data := cache.get(key)) is not None:
+            _count('hits')
+            return Response(data)
+
+        _count('misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        return response
+
+
+# Every model rendered by the cached endpoints bumps the data version when written.
+# Bulk writers (loaddata, createusers) suspend the receivers and bump it once.
+
+versioned_models = [Country, Chart, ChartGeneration, ChartEntry, CountryCluster, Artist, User]
+
+
+def data_changed(sender, **kwargs):
+    bump_data_version()
+
+
+def connect():
+    for model in versioned_models:
+        post_save.connect(data_changed, sender=model)
+        post_delete.connect(data_changed, sender=model)
+
+
+def disconnect():
+    for model in versioned_models:
+        post_save.disconnect(data_changed, sender=model)
+        post_delete.disconnect(data_changed, sender=model)
+
+
+@contextmanager
+def suspend_versioning():
+    disconnect()
+    try:
+        yield
+    finally:
+        connect()
+        bump_data_version()
@@ -0,0 +1,130 @@
+"""Market clustering computed from the data already in the database.
+
+Countries are described by their internet penetration, their population and
+two features derived from the current charts: the share of their chart held
+by local artists and the share of the chart entries of their artists found
+abroad. They are grouped with k-means (NumPy, seeded, so a run is
+reproducible) and each cluster is labelled MATURE when local artists hold
+more of its charts than average: a market with its own scene rather than
+one importing its music."""
+import numpy as np
+from django.db.models import Count, F, Q
+
+from .models import ChartEntry, Country, CountryCluster
+
+feature_names = ('internet_users', 'log_population', 'local_share', 'exported_share')
+batch_size = 2000
+
+
+def country_features() -> tuple[list[str], np.ndarray]:
+    """Country codes and their countries x features matrix."""
+    countries = list(Country.objects.order_by('iso2').values_list('iso2', 'internet_users', 'population'))
+    local = {
+        iso2: local / total
+        for iso2, total, local in ChartEntry.objects.current()
+        .values_list('chart__country')
+        .annotate(total=Count('id'), local=Count('id', filter=Q(artist__nationality=F('chart__country'))))
+        .order_by()
+    }
+    exported = {
+        nationality: foreign / total
+        for nationality, total, foreign in ChartEntry.objects.current()
+        .values_list('artist__nationality')
+        .annotate(total=Count('id'), foreign=Count('id', filter=~Q(chart__country=F('artist__nationality'))))
+        .order_by()
+    }
+    features = np.array([
+        (internet_users, np.log10(max(population, 1)), local.get(iso2, 0.0), exported.get(iso2, 0.0))
+        for iso2, internet_users, population in countries
+    ], dtype=float).reshape(-1, len(feature_names))
+    return [iso2 for iso2, _, _ in countries], features
+
+
+def standardize(features: np.ndarray) -> np.ndarray:
+    std = features.std(axis=0)
+    return (features - features.mean(axis=0)) / np.where(std == 0, 1, std)
+
+
+def kmeans(points: np.ndarray, k: int, seed: int = 0, centroids: np.ndarray | None = None, iterations: int = 100):
+    """Lloyd's k-means, seeded with k-means++ unless `centroids` are given.
+    Returns (labels, centroids)."""
+    rng = np.random.default_rng(seed)
+    if centroids is None:
+        chosen = [rng.integers(len(points))]
+        while len(chosen) < k:
+            distances = ((points[:, None] - points[chosen][None]) ** 2).sum(axis=2).min(axis=1)
+            if (total := distances.sum()) > 0:
+                chosen.append(rng.choice(len(points), p=distances / total))
+            else:
+                # Every point sits on a chosen centroid (identical vectors): any point not chosen yet
+                chosen.append(rng.choice(np.setdiff1d(np.arange(len(points)), chosen)))
+        centroids = points[chosen]
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = ((points[:, None] - centroids[None]) ** 2).sum(axis=2).argmin(axis=1)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+        for cluster in range(k):
+            # An emptied cluster keeps its centroid
+            if (members := labels == cluster).any():
+                centroids[cluster] = points[members].mean(axis=0)
+    return labels, centroids
+
+
+def current_centroids(countries: list[str], points: np.ndarray) -> np.ndarray | None:
+    """Centroids of the stored MATURE and POTENTIAL groups, to warm start k-means
+    from the previous clustering. None unless both groups are populated."""
+    labels = dict(CountryCluster.objects.values_list('country_id', 'cluster'))
+    centroids = []
+    for choice in (CountryCluster.ClusterChoices.MATURE, CountryCluster.ClusterChoices.POTENTIAL):
+        members = np.array([labels.get(iso2) == choice for iso2 in countries], dtype=bool)
+        if not members.any():
+            return None
+        centroids.append(points[members].mean(axis=0))
+    return np.array(centroids)
+
+
+def cluster_countries(k: int = 2, seed: int = 0, warm: bool = True) -> dict[str, str]:
+    """MATURE or POTENTIAL label of every country.
+
+    With `warm`, and k = 2, k-means starts from the stored clusters so that a
+    chart refresh only moves the countries whose features actually shifted."""
+    countries, features = country_features()
+    if len(countries) < k:
+        return {iso2: CountryCluster.ClusterChoices.POTENTIAL for iso2 in countries}
+
+    points = standardize(features)
+    centroids = current_centroids(countries, points) if warm and k == 2 else None
+    labels, _ = kmeans(points, k, seed, centroids)
+
+    local_share = features[:, feature_names.index('local_share')]
+    mature = {
+        cluster for cluster in range(k)
+        if (labels == cluster).any() and local_share[labels == cluster].mean() > local_share.mean()
+    }
+    return {
+        iso2: CountryCluster.ClusterChoices.MATURE if label in mature else CountryCluster.ClusterChoices.POTENTIAL
+        for iso2, label in zip(countries, labels.tolist())
+    }
+
+
+def save_clusters(clusters: dict[str, str]) -> tuple[int, int, int]:
+    """Write the labels in bulk; (created, updated, deleted) row counts."""
+    current = {
+        iso2: (cluster_id, cluster)
+        for cluster_id, iso2, cluster in CountryCluster.objects.values_list('id', 'country_id', 'cluster')
+    }
+    created = [
+        CountryCluster(country_id=iso2, cluster=cluster)
+        for iso2, cluster in clusters.items() if iso2 not in current
+    ]
+    updated = [
+        CountryCluster(id=current[iso2][0], cluster=cluster)
+        for iso2, cluster in clusters.items() if iso2 in current and current[iso2][1] != cluster
+    ]
+    CountryCluster.objects.bulk_create(created, batch_size=batch_size)
+    CountryCluster.objects.bulk_update(updated, ['cluster'], batch_size=batch_size)
+    deleted, _ = CountryCluster.objects.filter(country_id__in=current.keys() - clusters.keys()).delete()
+    return len(created), len(updated), deleted
@@ -0,0 +1,168 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F, Min
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import Artist, Chart, ChartEntry, ExportPotential
+
+batch_size = 2000
+
+
+def group_by_country(rows) -> list[dict]:
+    """Shape (country, artist name, rank) rows, ordered by country, into the export potential payload."""
+    grouped = defaultdict(list)
+    for country, name, rank in rows:
+        grouped[country].append({"name": name, "rank": rank})
+    return [{"country": country, "artists": artists} for country, artists in grouped.items()]
+
+
+def live_export_potential(artist: Artist) -> list[dict]:
+    """Export potential computed from the current charts: best rank of every
+    same-nationality artist in each foreign chart the artist is not part of."""
+    rows = (
+        ChartEntry.objects.current()
+        .filter(artist__nationality=artist.nationality)
+        .exclude(artist=artist)
+        .exclude(chart__country=artist.nationality)
+        .exclude(chart__in=Chart.objects.current().filter(entries__artist=artist))
+        .values_list('chart__country', 'artist__name')
+        .annotate(best_rank=Min('rank'))
+        .order_by('chart__country', 'best_rank', 'artist__name')
+    )
+    return group_by_country(rows)
+
+
+def stored_export_potential_rows(artist_id: int, nationality):
+    """(country, artist name, rank) rows of `stored_export_potential`. The
+    `nationality` may be an expression, such as a subquery on the artist."""
+    return (
+        ExportPotential.objects.filter(nationality=nationality)
+        .exclude(artist_id=artist_id)
+        .exclude(country__in=ChartEntry.objects.current().filter(artist_id=artist_id).values('chart__country'))
+        .values_list('country', 'artist__name', 'rank')
+        .order_by('country', 'rank', 'artist__name')
+    )
+
+
+def stored_export_potential(artist: Artist) -> list[dict]:
+    """Same result as `live_export_potential`, read from the ExportPotential table."""
+    return group_by_country(stored_export_potential_rows(artist.pk, artist.nationality))
+
+
+def batch_export_potential(artists) -> dict[int, list[dict]]:
+    """`stored_export_potential` for several artists at once: the rows of each
+    nationality are read once and shared by every artist holding it."""
+    artists = list(artists)
+    rows = defaultdict(list)
+    for nationality, country, artist_id, name, rank in (
+        ExportPotential.objects.filter(nationality__in={artist.nationality for artist in artists})
+        .values_list('nationality', 'country', 'artist_id', 'artist__name', 'rank')
+        .order_by('country', 'rank', 'artist__name')
+    ):
+        rows[nationality].append((country, artist_id, name, rank))
+
+    present = defaultdict(set)
+    for artist_id, country in ChartEntry.objects.current().filter(artist__in=artists).values_list('artist_id', 'chart__country'):
+        present[artist_id].add(country)
+
+    return {
+        artist.pk: group_by_country(
+            (country, name, rank)
+            for country, artist_id, name, rank in rows[artist.nationality]
+            if artist_id != artist.pk and country not in present[artist.pk]
+        )
+        for artist in artists
+    }
+
+
+def foreign_entries():
+    return (
+        ChartEntry.objects.current()
+        .exclude(chart__country=F('artist__nationality'))
+        .values_list('artist_id', 'chart__country_id', 'artist__nationality', 'rank')
+    )
+
+
+def _create(entries) -> int:
+    rows = [
+        ExportPotential(artist_id=artist_id, country_id=country_id, nationality=nationality, rank=rank)
+        for artist_id, country_id, nationality, rank in entries
+    ]
+    ExportPotential.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def rebuild_export_potential() -> int:
+    with transaction.atomic():
+        ExportPotential.objects.all().delete()
+        return _create(foreign_entries())
+
+
+def refresh_artists_export_potential(artist_ids) -> int:
+    artist_ids = list(artist_ids)
+    created = 0
+    with transaction.atomic():
+        for start in range(0, len(artist_ids), batch_size):
+            chunk = artist_ids[start:start + batch_size]
+            ExportPotential.objects.filter(artist_id__in=chunk).delete()
+            created += _create(foreign_entries().filter(artist_id__in=chunk))
+    return created
+
+
+def verify_export_potential() -> tuple[set, set]:
+    """Rows missing from the table and rows the table holds but should not."""
+    expected = set(foreign_entries())
+    stored = set(ExportPotential.objects.values_list('artist_id', 'country_id', 'nationality', 'rank'))
+    return expected - stored, stored - expected
+
+
+# Signal receivers keeping the table in sync with single row writes.
+# Bulk writers (loaddata) suspend them and refresh the table themselves.
+
+def chart_entry_changed(sender, instance, **kwargs):
+    if Artist.objects.filter(pk=instance.artist_id).exists():
+        refresh_artists_export_potential([instance.artist_id])
+
+
+def artist_pre_save(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._nationality_changed = False
+        return
+    previous = Artist.objects.filter(pk=instance.pk).values_list('nationality', flat=True).first()
+    instance._nationality_changed = previous is not None and previous != instance.nationality
+
+
+def artist_post_save(sender, instance, created, **kwargs):
+    if getattr(instance, '_nationality_changed', False):
+        refresh_artists_export_potential([instance.pk])
+
+
+receivers = [
+    (post_save, chart_entry_changed, ChartEntry),
+    (post_delete, chart_entry_changed, ChartEntry),
+    (pre_save, artist_pre_save, Artist),
+    (post_save, artist_post_save, Artist),
+]
+
+
+def connect():
+    for signal, receiver, sender in receivers:
+        signal.connect(receiver, sender=sender)
+
+
+def disconnect():
+    for signal, receiver, sender in receivers:
+        signal.disconnect(receiver, sender=sender)
+
+
+@contextmanager
+def suspend_sync():
+    # Disconnecting (rather than short-circuiting) the receivers also lets
+    # Django fast-delete chart entries again
+    disconnect()
+    try:
+        yield
+    finally:
+        connect()
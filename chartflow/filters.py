@@ -0,0 +1,72 @@
+from django import forms
+from django.db.models import F, Subquery, Window
+from django.db.models.functions import RowNumber
+from django_filters import rest_framework as filters
+from django_filters.fields import ChoiceField
+
+from .models import Chart, ChartEntry, CountryCluster
+
+
+class PositiveIntegerFilter(filters.NumberFilter):
+    field_class = forms.IntegerField
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('min_value', 1)
+        super().__init__(*args, **kwargs)
+
+
+def filter_upper(queryset, name, value):
+    return queryset.filter(**{name: value.upper()})
+
+
+class UpperChoiceField(ChoiceField):
+    def to_python(self, value):
+        return super().to_python(value).upper()
+
+
+class UpperChoiceFilter(filters.ChoiceFilter):
+    """Case-insensitive like `filter_upper`: the value is upper-cased before
+    being checked against the (upper-case) choices."""
+    field_class = UpperChoiceField
+
+
+class EntryFilter(filters.FilterSet):
+    """Filters on the entries of a chart, all applied in SQL.
+
+    `top=N` keeps the N best ranked entries of each chart among those matching
+    the filters declared before it (ROW_NUMBER() over each chart), so "top 10 French
+    artists in every country" is `?nationality=FR&top=10`."""
+    nationality = filters.CharFilter(field_name='artist__nationality', method=filter_upper)
+    rank_min = filters.NumberFilter(field_name='rank', lookup_expr='gte')
+    rank_max = filters.NumberFilter(field_name='rank', lookup_expr='lte')
+    top = PositiveIntegerFilter(method='filter_top')
+
+    class Meta:
+        model = ChartEntry
+        fields = []
+
+    def filter_top(self, queryset, name, value):
+        # The positions are numbered in a subquery: in the outer query, the
+        # filters that follow and the pagination cursor would renumber them
+        position = Window(RowNumber(), partition_by=[F('chart')], order_by=[F('rank').asc(), F('id').asc()])
+        top = queryset.order_by().annotate(chart_position=position).filter(chart_position__lte=value)
+        return queryset.filter(id__in=Subquery(top.values('id')))
+
+
+class ChartEntryFilter(EntryFilter):
+    country = filters.CharFilter(field_name='chart__country', method=filter_upper)
+    cluster = UpperChoiceFilter(field_name='chart__country__cluster__cluster', choices=CountryCluster.ClusterChoices.choices)
+
+    class Meta:
+        model = ChartEntry
+        fields = []
+
+
+class ChartFilter(filters.FilterSet):
+    """Filters the charts themselves; EntryFilter narrows the entries listed in each chart."""
+    country = filters.CharFilter(field_name='country', method=filter_upper)
+    cluster = UpperChoiceFilter(field_name='country__cluster__cluster', choices=CountryCluster.ClusterChoices.choices)
+
+    class Meta:
+        model = Chart
+        fields = []
@@ -0,0 +1,66 @@
+"""Password hashing off the event loop.
+
+PBKDF2 takes tens of milliseconds of CPU per login. The async login view
+runs it on a bounded thread pool (hashlib releases the GIL while hashing, so
+the threads do run in parallel) and admits at most CHARTFLOW_LOGIN_WORKERS +
+CHARTFLOW_LOGIN_QUEUE hashes at a time. Logins past that are refused at once
+with a 503, instead of queueing behind a backlog they would time out in."""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self, workers: int, queue: int):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    async def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PoolSaturated
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.slots.release()
+
+    async def verify(self, user, password) -> bool:
+        """`user.check_password(password)`, with the hashing on the pool."""
+        valid, outdated = await self.run(verify_password, user.password if user else None, password)
+        if valid and outdated:
+            # Same upgrade as AbstractBaseUser.check_password, to the current hasher
+            await self.run(user.set_password, password)
+            await user.asave(update_fields=['password'])
+        return valid
+
+
+def verify_password(encoded, password) -> tuple[bool, bool]:
+    """(valid, outdated hash) of `password` against the `encoded` hash."""
+    if encoded is None or password is None:
+        # Unknown users cost the same time as known ones, see ModelBackend.authenticate
+        make_password(password)
+        return False, False
+    outdated = []
+    valid = check_password(password, encoded, setter=outdated.append)
+    return valid, bool(outdated)
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def hashing_pool() -> HashingPool:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                workers = getattr(settings, 'CHARTFLOW_LOGIN_WORKERS', None) or os.cpu_count() or 1
+                _pool = HashingPool(workers, getattr(settings, 'CHARTFLOW_LOGIN_QUEUE', 8 * workers))
+    return _pool
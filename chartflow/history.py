@@ -0,0 +1,83 @@
+"""Dated chart snapshots and the range queries served from them."""
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+
+from .models import Artist, ChartEntry, ChartSnapshot
+
+batch_size = 500
+
+
+def take_snapshots(snapshot_date: date) -> int:
+    """Snapshot the current charts on `snapshot_date`, replacing the snapshots
+    of a previous load the same day."""
+    entries = defaultdict(list)
+    for country, artist_id, rank in ChartEntry.objects.current().values_list('chart__country', 'artist_id', 'rank'):
+        entries[country].append((artist_id, rank))
+
+    snapshots = [ChartSnapshot.pack(country, snapshot_date, rows) for country, rows in entries.items()]
+    with transaction.atomic():
+        ChartSnapshot.objects.filter(date=snapshot_date).delete()
+        ChartSnapshot.objects.bulk_create(snapshots, batch_size=batch_size)
+    return len(snapshots)
+
+
+def prune_snapshots(keep_days: int, today: date | None = None) -> int:
+    """Drop the snapshots older than `keep_days`, so weekly loads stay bounded."""
+    cutoff = (today or date.today()) - timedelta(days=keep_days)
+    deleted, _ = ChartSnapshot.objects.filter(date__lt=cutoff).delete()
+    return deleted
+
+
+def artist_trajectory(artist_id: int, start: date, end: date, country: str | None = None) -> list[dict]:
+    """Rank of the artist in every snapshot between `start` and `end`, by date then country.
+
+    Only the snapshots of the range are read (date index), and each is searched
+    with NumPy instead of being expanded into rows."""
+    snapshots = ChartSnapshot.objects.filter(date__range=(start, end))
+    if country:
+        snapshots = snapshots.filter(country=country)
+
+    trajectory = []
+    for snapshot in snapshots.order_by('date', 'country'):
+        artist_ids, ranks = snapshot.unpack()
+        if len(found := np.flatnonzero(artist_ids == artist_id)):
+            trajectory.append({'date': snapshot.date, 'country': snapshot.country, 'rank': int(ranks[found[0]])})
+    return trajectory
+
+
+def snapshot_on(country: str, day: date) -> ChartSnapshot | None:
+    """The latest snapshot of the country's chart taken on or before `day`."""
+    return ChartSnapshot.objects.filter(country=country, date__lte=day).order_by('-date').first()
+
+
+def chart_movers(country: str, start: date, end: date) -> dict:
+    """Rank changes of the country's chart between the snapshots in effect on
+    `start` and on `end`: artists that climbed or fell, entered or dropped out."""
+    before, after = snapshot_on(country, start), snapshot_on(country, end)
+    ranks_before = dict(zip(*(array.tolist() for array in before.unpack()))) if before else {}
+    ranks_after = dict(zip(*(array.tolist() for array in after.unpack()))) if after else {}
+    names = dict(Artist.objects.filter(pk__in=ranks_before.keys() | ranks_after.keys()).values_list('id', 'name'))
+
+    movers = []
+    for artist_id in ranks_before.keys() | ranks_after.keys():
+        rank_before, rank_after = ranks_before.get(artist_id), ranks_after.get(artist_id)
+        movers.append({
+            'artist_id': artist_id,
+            'name': names.get(artist_id),
+            'from_rank': rank_before,
+            'to_rank': rank_after,
+            'change': rank_before - rank_after if rank_before and rank_after else None,
+        })
+    # Biggest moves first, then entries and exits
+    movers.sort(key=lambda mover: (
+        mover['change'] is None, -abs(mover['change'] or 0), mover['to_rank'] or mover['from_rank'], mover['artist_id']
+    ))
+    return {
+        'country': country,
+        'from': before.date if before else None,
+        'to': after.date if after else None,
+        'movers': movers,
+    }
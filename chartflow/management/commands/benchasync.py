@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+
+from chartflow.authentication import login_payload
+from chartflow.models import Artist, User
+
+no_response_cache = {'responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class PeakThreads:
+    """Highest number of live threads seen while the block runs."""
+
+    def __enter__(self):
+        self.peak, self.running = threading.active_count(), True
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, threading.active_count() - 1)
+            sleep(0.002)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.sampler.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests per second of the read endpoints: sync views on threads (WSGI), sync views "
+        "under the ASGI handler, and the async views under the ASGI handler"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", default="admin@gmail.com", help="Account the requests are made as")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and mode")
+        parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once")
+        parser.add_argument("--with-cache", action="store_true", help="Keep the response cache of the sync views")
+
+    def wsgi(self, url, requests, concurrency, headers):
+        def get(_):
+            try:
+                return Client(headers=headers).get(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(get, range(requests)))
+
+    async def asgi(self, url, requests, concurrency, headers):
+        client = AsyncClient()
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def get():
+            async with in_flight:
+                return (await client.get(url, headers=headers)).status_code
+
+        return await asyncio.gather(*(get() for _ in range(requests)))
+
+    def handle(self, *args, **options):
+        if (user := User.objects.filter(email=options["email"]).first()) is None:
+            raise CommandError(f"No user {options['email']}")
+        if (artist := Artist.objects.order_by("id").first()) is None:
+            raise CommandError("No artist, load the data first")
+        headers = {"authorization": f"Bearer {login_payload(user)['access']}"}
+        requests, concurrency = options["requests"], options["concurrency"]
+
+        modes = (
+            ("wsgi, sync views", "", lambda url: self.wsgi(url, requests, concurrency, headers)),
+            ("asgi, sync views", "", lambda url: asyncio.run(self.asgi(url, requests, concurrency, headers))),
+            ("asgi, async views", "/async", lambda url: asyncio.run(self.asgi(url, requests, concurrency, headers))),
+        )
+        urls = [
+            "/countries/", "/charts/?top=10", "/chart-entries/",
+            f"/artists/{artist.pk}/performance/", f"/export-analysis/potential/{artist.pk}/",
+        ]
+        # The in-process clients send requests to the host `testserver`
+        overrides = {"ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"]}
+        if not options["with_cache"]:
+            overrides["CACHES"] = {**settings.CACHES, **no_response_cache}
+        with override_settings(**overrides):
+            for url in urls:
+                self.stdout.write(url)
+                for name, prefix, run in modes:
+                    with PeakThreads() as threads:
+                        start = perf_counter()
+                        statuses = run(prefix + url)
+                        elapsed = perf_counter() - start
+                    if failed := [status for status in statuses if status != 200]:
+                        raise CommandError(f"{prefix}{url}: {len(failed)} responses were not 200 ({failed[0]})")
+                    self.stdout.write(f"  {name:<20} {requests / elapsed:>8.1f} req/s   peak threads {threads.peak}")
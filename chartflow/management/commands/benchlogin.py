@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chartflow.authentication import ScopedRefreshToken
+from chartflow.blacklist import blacklist_filter
+from chartflow.models import User
+
+
+class Command(BaseCommand):
+    help = "Logins per second of the sync and async login views, and refresh token blacklist checks per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", default="admin@gmail.com", help="Account to log in with")
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--logins", type=int, default=200, help="Logins per view")
+        parser.add_argument("--concurrency", type=int, default=16, help="Logins in flight at once")
+        parser.add_argument("--checks", type=int, default=2000, help="Blacklist checks per variant")
+
+    def sync_logins(self, credentials, logins, concurrency):
+        """Like `concurrency` WSGI worker threads, each pinned for a whole login."""
+        def login(_):
+            try:
+                return Client().post("/users/authenticate/", credentials).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(login, range(logins)))
+
+    async def async_logins(self, credentials, logins, concurrency):
+        client = AsyncClient()
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with in_flight:
+                response = await client.post("/async/users/authenticate/", credentials, content_type="application/json")
+                return response.status_code
+
+        return await asyncio.gather(*(login() for _ in range(logins)))
+
+    def report(self, name, count, elapsed, unit):
+        self.stdout.write(f"{name:<28} {count / elapsed:>9.1f} {unit}/s   ({count} in {elapsed:.2f}s)")
+
+    def handle(self, *args, **options):
+        credentials = {"email": options["email"], "password": options["password"]}
+        if (user := User.objects.filter(email=options["email"]).first()) is None or not user.check_password(options["password"]):
+            raise CommandError(f"Cannot log in as {options['email']}")
+        first_token = (OutstandingToken.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+
+        try:
+            # The in-process clients send requests to the host `testserver`
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                for name, run in (
+                    ("sync login (threads)", lambda: self.sync_logins(credentials, options["logins"], options["concurrency"])),
+                    ("async login (event loop)", lambda: asyncio.run(self.async_logins(credentials, options["logins"], options["concurrency"]))),
+                ):
+                    start = perf_counter()
+                    statuses = run()
+                    self.report(name, len(statuses), perf_counter() - start, "logins")
+                    if refused := [code for code in statuses if code != 200]:
+                        self.stdout.write(f"{'':<28} {len(refused)} refused ({', '.join(sorted({str(code) for code in refused}))})")
+
+            token = str(RefreshToken.for_user(user))
+            blacklist_filter.sync()
+            for name, token_class in (("blacklist check (database)", RefreshToken), ("blacklist check (filter)", ScopedRefreshToken)):
+                refresh = token_class(token)
+                start = perf_counter()
+                for _ in range(options["checks"]):
+                    refresh.check_blacklist()
+                self.report(name, options["checks"], perf_counter() - start, "checks")
+        finally:
+            # The benchmark tokens are not kept
+            OutstandingToken.objects.filter(id__gte=first_token).delete()
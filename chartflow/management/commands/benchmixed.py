@@ -0,0 +1,123 @@
+import random
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+
+from chartflow.models import Chart, ChartEntry
+
+primary_alias, replica_alias = "bench_primary", "bench_replica"
+
+
+class Command(BaseCommand):
+    help = (
+        "Chart reads per second while a writer keeps rewriting chart entries, for Django's default "
+        "SQLite settings, the performance profile, and the performance profile with a read replica"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5, help="Duration of each variant")
+        parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+        parser.add_argument("--timeout", type=float, default=5, help="SQLite busy timeout of the connections, in seconds")
+
+    def configure(self, alias, name, profile, **options):
+        config = {"ENGINE": "django.db.backends.sqlite3", "NAME": name, **profile}
+        config["OPTIONS"] = {**profile.get("OPTIONS", {}), **options}
+        connections.settings[alias] = connections.configure_settings({"default": settings.DATABASES["default"], alias: config})[alias]
+
+    def run(self, read_alias, chart_ids, seconds, readers):
+        """Readers list the entries of a random chart, a writer rewrites the
+        entries of one chart per transaction, as an ingest would."""
+        stop = threading.Event()
+        latencies, errors, writes = [], [], [0]
+
+        def read():
+            try:
+                while not stop.is_set():
+                    start = perf_counter()
+                    try:
+                        list(ChartEntry.objects.using(read_alias).filter(chart_id=random.choice(chart_ids)).select_related("artist").order_by("rank")[:100])
+                    except OperationalError as error:
+                        errors.append(str(error))
+                        continue
+                    latencies.append(perf_counter() - start)
+            finally:
+                connections[read_alias].close()
+
+        def write():
+            try:
+                while not stop.is_set():
+                    try:
+                        with transaction.atomic(using=primary_alias):
+                            ChartEntry.objects.using(primary_alias).filter(chart_id=random.choice(chart_ids)).update(rank=F("rank"))
+                    except OperationalError as error:
+                        errors.append(str(error))
+                        continue
+                    writes[0] += 1
+            finally:
+                connections[primary_alias].close()
+
+        threads = [threading.Thread(target=read) for _ in range(readers)] + [threading.Thread(target=write)]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, writes[0], errors, perf_counter() - start
+
+    def handle(self, *args, **options):
+        chart_ids = list(Chart.objects.values_list("id", flat=True))
+        if not chart_ids:
+            raise CommandError("No chart, load the data first")
+        default_profile, performance_profile = settings.SQLITE_PROFILES["default"], settings.SQLITE_PROFILES["performance"]
+        timeout = options["timeout"]
+
+        with tempfile.TemporaryDirectory() as directory:
+            variants = (
+                ("default settings", default_profile, "DELETE", False),
+                ("performance profile", performance_profile, "WAL", False),
+                ("performance + replica", performance_profile, "WAL", True),
+            )
+            for name, profile, journal_mode, with_replica in variants:
+                path = Path(directory) / f"{journal_mode.lower()}-{with_replica}.sqlite3"
+                connection.ensure_connection()
+                copy = sqlite3.connect(path)
+                try:
+                    connection.connection.backup(copy)
+                    copy.execute(f"PRAGMA journal_mode={journal_mode}")
+                finally:
+                    copy.close()
+
+                self.configure(primary_alias, path, profile, timeout=timeout)
+                read_alias = primary_alias
+                if with_replica:
+                    replica_path = Path(directory) / "replica.sqlite3"
+                    with sqlite3.connect(path) as source, sqlite3.connect(replica_path) as copy:
+                        source.backup(copy)
+                    source.close()
+                    copy.close()
+                    self.configure(replica_alias, replica_path, profile, timeout=timeout, init_command="PRAGMA query_only=ON")
+                    read_alias = replica_alias
+
+                try:
+                    latencies, writes, errors, elapsed = self.run(read_alias, chart_ids, options["seconds"], options["readers"])
+                finally:
+                    for alias in (primary_alias, replica_alias):
+                        connections.settings.pop(alias, None)
+
+                p50, p95 = (quantiles(latencies, n=20)[i] * 1000 for i in (9, 18)) if len(latencies) > 1 else (0, 0)
+                self.stdout.write(
+                    f"{name:<22} {len(latencies) / elapsed:>8.1f} reads/s   {writes / elapsed:>6.1f} writes/s   "
+                    f"read p50 {p50:.1f} ms  p95 {p95:.1f} ms   {len(errors)} errors"
+                )
+                if errors:
+                    self.stdout.write(f"{'':<22} {errors[0]}")
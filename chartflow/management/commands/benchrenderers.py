@@ -0,0 +1,65 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from chartflow import renderers
+from chartflow.models import Artist, Chart, ChartEntry
+from chartflow.readers import ArtistReader, ChartEntryReader, ChartReader
+from chartflow.serializers import ArtistSerializer, ChartEntrySerializer, ChartSerializer
+
+class Command(BaseCommand):
+    help = "Compare the stock JSON renderer with FastJSONRenderer on the current chart payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Renders per payload and renderer (best time is kept)")
+        parser.add_argument("--entries", type=int, default=1000, help="Number of chart entries in the entries payload")
+
+    def payloads(self, entries):
+        charts = Chart.objects.current().select_related('country')
+        entry_queryset = ChartEntry.objects.current().select_related('artist__manager', 'chart__country').order_by('id')
+        artists = Artist.objects.select_related('manager').order_by('id')[:entries]
+        payloads = {
+            "charts (serializer)": ChartSerializer(
+                charts.prefetch_related(
+                    Prefetch('entries', queryset=ChartEntry.objects.select_related('artist__manager').order_by('id'))
+                ),
+                many=True,
+            ).data,
+            "entries (serializer)": ChartEntrySerializer(entry_queryset[:entries], many=True).data,
+            "artists (serializer)": ArtistSerializer(artists, many=True).data,
+        }
+        # The fast read path, with plain dicts and with pre-encoded fragments
+        for name, reader, queryset in (
+            ("charts", ChartReader(), charts),
+            ("entries", ChartEntryReader(), entry_queryset[:entries]),
+            ("artists", ArtistReader(), artists),
+        ):
+            rows = list(reader.values(queryset))
+            payloads[f"{name} (dicts)"] = reader.shape(rows, pack=renderers.unchanged)
+            payloads[f"{name} (fragments)"] = reader.shape(rows, pack=renderers.fragment)
+        return payloads
+
+    def best(self, renderer, data, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            output = renderer.render(data)
+            timings.append(perf_counter() - start)
+        return min(timings), output
+
+    def handle(self, *args, **options):
+        stock, fast = JSONRenderer(), renderers.FastJSONRenderer()
+        backend = "orjson" if renderers.orjson is not None else "json (orjson is not installed)"
+        self.stdout.write(f"FastJSONRenderer backend: {backend}, splices fragments: {fast.splice_fragments}")
+
+        for name, data in self.payloads(options["entries"]).items():
+            stock_time, expected = self.best(stock, data, options["repeat"])
+            fast_time, output = self.best(fast, data, options["repeat"])
+            if output != expected:
+                raise CommandError(f"{name}: FastJSONRenderer output differs from the stock renderer")
+            self.stdout.write(
+                f"{name:<22} {len(output) / 1024:>8.0f} KiB   stock {stock_time * 1000:>8.1f}ms   "
+                f"fast {fast_time * 1000:>8.1f}ms   x{stock_time / fast_time:.1f}"
+            )
@@ -0,0 +1,38 @@
+from collections import Counter
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from chartflow import cache, clustering
+
+class Command(BaseCommand):
+    help = "Cluster the countries from their indicators and current charts, and store the MATURE / POTENTIAL labels"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=2, help="Number of k-means clusters")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the k-means initialisation")
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Ignore the stored clusters instead of starting from them",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Print the labels without saving them")
+
+    def handle(self, *args, **options):
+        if options["k"] < 2:
+            raise CommandError("--k must be at least 2")
+
+        start = perf_counter()
+        clusters = clustering.cluster_countries(options["k"], options["seed"], warm=not options["cold"])
+        for label, count in sorted(Counter(clusters.values()).items()):
+            members = sorted(iso2 for iso2, cluster in clusters.items() if cluster == label)
+            self.stdout.write(f"{label:<10} {count:>3}  {' '.join(members)}")
+
+        if options["dry_run"]:
+            return
+        with cache.suspend_versioning(), transaction.atomic():
+            created, updated, deleted = clustering.save_clusters(clusters)
+        self.stdout.write(self.style.SUCCESS(
+            f"+{created} ~{updated} -{deleted} clusters in {perf_counter() - start:.3f}s"
+        ))
@@ -1,45 +1,125 @@
+from time import perf_counter
 
+from django.contrib.auth.hashers import make_password
 from django.core.management import BaseCommand
+from django.db import transaction
 
+from chartflow import cache, replica
 from chartflow.models import Artist, User
 import random
 
 class Command(BaseCommand):
     help = "Create users"
+    password = "password"
+    batch_size = 2000
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
+        parser.add_argument("--managers", type=int, default=50, help="Number of manager accounts")
+        parser.add_argument("--max-artists", type=int, default=10, help="Maximum number of artists per manager")
+        parser.add_argument("--seed", type=int, default=None, help="Seed of the random artist assignment")
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help="Create users one by one, hashing every password (slow, kept to diff results)",
+        )
+
+    def handle_legacy(self, managers, max_artists):
         User.objects.all().delete()
-        
+
         admin = User(
             username="admin",
             email="admin@gmail.com",
             role="admin"
         )
-        admin.set_password("password")
+        admin.set_password(self.password)
         admin.is_staff = True
         admin.save()
-        
+
+        # Artists are drawn like the bulk loader does, so that both give the same accounts for a seed
+        artist_ids = list(Artist.objects.filter(manager__isnull=True).order_by("id").values_list("id", flat=True))
+        random.shuffle(artist_ids)
+
         # Managers
-        for i in range(50):
+        for i in range(managers):
             manager = User(
                 username=f"manager{i+1}",
                 email=f"manager{i+1}@gmail.com",
                 role="manager"
             )
-            manager.set_password("password")
+            manager.set_password(self.password)
             manager.save()
-            
+
             # Artists
-            artists = Artist.objects.filter(manager__isnull=True).order_by('?').all()[:random.randint(0, 10)]
-            for x, artist in enumerate(artists):
+            count = random.randint(0, max_artists)
+            picked, artist_ids = artist_ids[:count], artist_ids[count:]
+            for x, artist_id in enumerate(picked):
+                artist = Artist.objects.get(pk=artist_id)
                 artist_user = User(
                     username=f"artist.{i+1}.{x+1}",
                     email=f"artist.{i+1}.{x+1}@gmail.com",
                     role="artist"
                 )
-                artist_user.set_password("password")
-                artist_user.save() 
-                
+                artist_user.set_password(self.password)
+                artist_user.save()
+
                 artist.manager = manager
                 artist.user = artist_user
-                artist.save()
\ No newline at end of file
+                artist.save()
+
+    def handle_bulk(self, managers, max_artists):
+        # Every seed account shares the same password, so it is hashed only once
+        password = make_password(self.password)
+
+        with transaction.atomic():
+            User.objects.all().delete()
+
+            # Deleting the users released every artist, they are sampled once for all managers
+            artist_ids = list(Artist.objects.filter(manager__isnull=True).order_by("id").values_list("id", flat=True))
+            random.shuffle(artist_ids)
+
+            users = [User(username="admin", email="admin@gmail.com", role="admin", is_staff=True, password=password)]
+            links = []
+            for i in range(managers):
+                manager = User(
+                    username=f"manager{i+1}",
+                    email=f"manager{i+1}@gmail.com",
+                    role="manager",
+                    password=password
+                )
+                users.append(manager)
+
+                count = random.randint(0, max_artists)
+                picked, artist_ids = artist_ids[:count], artist_ids[count:]
+                for x, artist_id in enumerate(picked):
+                    artist_user = User(
+                        username=f"artist.{i+1}.{x+1}",
+                        email=f"artist.{i+1}.{x+1}@gmail.com",
+                        role="artist",
+                        password=password
+                    )
+                    users.append(artist_user)
+                    links.append((artist_id, manager, artist_user))
+
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            Artist.objects.bulk_update(
+                [Artist(id=artist_id, manager=manager, user=artist_user) for artist_id, manager, artist_user in links],
+                ["manager", "user"],
+                batch_size=self.batch_size,
+            )
+
+        self.stdout.write(f"Created {len(users)} users, {len(links)} of them linked to an artist")
+
+    def handle(self, *args, **options):
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+
+        start = perf_counter()
+        with cache.suspend_versioning():
+            if options["legacy"]:
+                self.handle_legacy(options["managers"], options["max_artists"])
+            else:
+                self.handle_bulk(options["managers"], options["max_artists"])
+        # Artists now point at their users and managers
+        if (elapsed := replica.refresh_replica()) is not None:
+            self.stdout.write(f"Replica refreshed in {elapsed:.3f}s")
+        self.stdout.write(self.style.SUCCESS(f"Done in {perf_counter() - start:.3f}s"))
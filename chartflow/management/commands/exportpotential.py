@@ -0,0 +1,41 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chartflow import exports
+from chartflow.models import Artist
+
+class Command(BaseCommand):
+    help = "Rebuild the export potential table and verify it against the live computation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--no-rebuild", action="store_true", help="Only verify the current table")
+        parser.add_argument("--verify", action="store_true", help="Compare the table with the current charts")
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=20,
+            help="Number of random artists whose endpoint payload is compared with the live query (with --verify)",
+        )
+
+    def handle(self, *args, **options):
+        if not options["no_rebuild"]:
+            start = perf_counter()
+            created = exports.rebuild_export_potential()
+            self.stdout.write(f"Rebuilt {created} rows in {perf_counter() - start:.3f}s")
+
+        if not options["verify"]:
+            return
+
+        missing, unexpected = exports.verify_export_potential()
+        mismatches = []
+        for artist in Artist.objects.order_by("?")[:options["sample"]]:
+            if exports.stored_export_potential(artist) != exports.live_export_potential(artist):
+                mismatches.append(artist.pk)
+
+        if missing or unexpected or mismatches:
+            raise CommandError(
+                f"Export potential table is out of date: {len(missing)} missing rows, "
+                f"{len(unexpected)} unexpected rows, payload mismatch for artists {mismatches}"
+            )
+        self.stdout.write(self.style.SUCCESS("Export potential table matches the live computation"))
@@ -1,11 +1,73 @@
+from contextlib import contextmanager
+from datetime import date
+from time import perf_counter
+
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 import pandas as pd
 
-from chartflow.models import Artist, Chart, ChartEntry, Country, CountryCluster
+from chartflow import cache, clustering, exports, history, replica
+from chartflow.models import Artist, Chart, ChartEntry, ChartGeneration, Country, CountryCluster
 
 class Command(BaseCommand):
     help = "Load initial data"
     datasets_root = "datasets/"
+    batch_size = 2000
+    entry_fields = ("rank", "peak_rank", "peak_date", "appearances", "consecutive_appearances", "entry_rank")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help="Use the row by row loader instead of the bulk one (slow, kept to diff results)",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Apply only the differences between the datasets and the database instead of reloading everything",
+        )
+        parser.add_argument(
+            "--keep-generations",
+            type=int,
+            default=0,
+            help="Number of retired chart generations kept after publishing a new one",
+        )
+        parser.add_argument(
+            "--compute-clusters",
+            action="store_true",
+            help="Cluster the countries from the loaded data (see clustercountries) instead of reading clusters.csv",
+        )
+        parser.add_argument(
+            "--snapshot-date",
+            type=date.fromisoformat,
+            default=None,
+            help="Date of the chart snapshot taken after the load (YYYY-MM-DD, defaults to today)",
+        )
+        parser.add_argument(
+            "--snapshot-retention",
+            type=int,
+            default=5 * 365,
+            help="Number of days of chart snapshots kept, 0 to keep them all",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=self.batch_size,
+            help="Number of rows per bulk insert",
+        )
+
+    @contextmanager
+    def timed(self, phase):
+        start = perf_counter()
+        yield
+        elapsed = perf_counter() - start
+        self.timings.append((phase, elapsed))
+
+    def report_timings(self):
+        total = sum(elapsed for _, elapsed in self.timings)
+        for phase, elapsed in self.timings:
+            self.stdout.write(f"{phase:<12} {elapsed:8.3f}s")
+        self.stdout.write(self.style.SUCCESS(f"{'total':<12} {total:8.3f}s"))
 
     def load_dataset(self, dataset) -> pd.DataFrame | None:
         try:
@@ -15,12 +77,44 @@ class Command(BaseCommand):
         except:
             return None
 
+    def cluster_choice(self, cluster: int) -> str:
+        if cluster == 0:
+            return CountryCluster.ClusterChoices.POTENTIAL
+        elif cluster == 1:
+            return CountryCluster.ClusterChoices.MATURE
+        elif cluster == 2:
+            # USA, we consider it as MATURE instead of being alone in it's cluster
+            return CountryCluster.ClusterChoices.MATURE
+        elif cluster == 3:
+            # India, we consider it as POTENTIAL because of huge local scene
+            return CountryCluster.ClusterChoices.POTENTIAL
+        raise CommandError(f"Cluster id not known : {cluster}")
+
+    def chart_rows(self, charts_df: pd.DataFrame):
+        """(country, artist name, nationality, entry fields) of every chart row."""
+        for iso2, name, nationality, rank, peak_rank, peak_date, appearances, consecutive, entry_rank in zip(
+            charts_df["country_iso2"].to_numpy(),
+            charts_df["artistName"].to_numpy(),
+            charts_df["artistCountry"].to_numpy(),
+            charts_df["currentRank"].to_numpy(),
+            charts_df["peakRank"].to_numpy(),
+            charts_df["peakDate"].to_numpy(),
+            charts_df["appearancesOnChart"].to_numpy(),
+            charts_df["consecutiveAppearancesOnChart"].to_numpy(),
+            charts_df["entryRank"].to_numpy(),
+        ):
+            yield iso2, name, nationality, dict(zip(self.entry_fields, (
+                int(rank), int(peak_rank), date.fromisoformat(peak_date), int(appearances), int(consecutive), int(entry_rank)
+            )))
+
+    # Legacy loaders: one query per row
+
     def load_countries(self, countries_df: pd.DataFrame) -> list[Country]:
         countries = []
         for _, country_df in countries_df.iterrows():
             country = Country(
-                iso2=country_df["country_iso2"], 
-                internet_users=country_df["%_internet"], 
+                iso2=country_df["country_iso2"],
+                internet_users=country_df["%_internet"],
                 population=country_df["population_total"]
             )
             country.save()
@@ -31,79 +125,315 @@ class Command(BaseCommand):
         artists = []
         for _, artist_df in artists_df.iterrows():
             artist = Artist(
-                name=artist_df["artistName"], 
-                nationality=artist_df["artistCountry"] 
+                name=artist_df["artistName"],
+                nationality=artist_df["artistCountry"]
             )
             artist.save()
             artists.append(artist)
         return artists
-    
+
     def load_charts(self, charts_df: pd.DataFrame, countries_df: pd.DataFrame) -> list[Chart]:
         charts = []
+        generation = ChartGeneration.objects.create()
         for _, country_df in countries_df.iterrows():
             chart = Chart(
-                country = Country.objects.get(iso2=country_df["country_iso2"])
+                country = Country.objects.get(iso2=country_df["country_iso2"]),
+                generation=generation
             )
             chart.save()
             for _, chart_df in charts_df[charts_df["country_iso2"] == country_df["country_iso2"]].iterrows():
-                print(f"{chart_df["artistName"]} - {chart_df["artistCountry"]}")
                 chart_entry = ChartEntry(
                     chart=chart,
                     artist = Artist.objects.get(name=chart_df["artistName"], nationality=chart_df["artistCountry"]),
-                    rank=int(chart_df["currentRank"])
+                    rank=int(chart_df["currentRank"]),
+                    peak_rank=int(chart_df["peakRank"]),
+                    peak_date=date.fromisoformat(chart_df["peakDate"]),
+                    appearances=int(chart_df["appearancesOnChart"]),
+                    consecutive_appearances=int(chart_df["consecutiveAppearancesOnChart"]),
+                    entry_rank=int(chart_df["entryRank"])
                 )
                 chart_entry.save()
             charts.append(chart)
+        # Readers only see the charts once they are complete
+        generation.publish()
         return charts
-    
+
     def load_clusters(self, clusters_df: pd.DataFrame) -> list[CountryCluster]:
         clusters = []
         for _, cluster_df in clusters_df.iterrows():
-            cluster = int(cluster_df["cluster"])
-            if cluster == 0:
-                cluster_choice = CountryCluster.ClusterChoices.POTENTIAL
-            elif cluster == 1:
-                cluster_choice = CountryCluster.ClusterChoices.MATURE
-            elif cluster == 2:
-                # USA, we consider it as MATURE instead of being alone in it's cluster
-                cluster_choice = CountryCluster.ClusterChoices.MATURE
-            elif cluster == 3:
-                # India, we consider it as POTENTIAL because of huge local scene
-                cluster_choice = CountryCluster.ClusterChoices.POTENTIAL
-            else:
-                raise CommandError(f"Cluster id not known : {cluster}")
-
             cluster = CountryCluster(
                 country=Country.objects.get(pk=cluster_df["country_iso2"]),
-                cluster=cluster_choice
+                cluster=self.cluster_choice(int(cluster_df["cluster"]))
             )
             cluster.save()
             clusters.append(cluster)
         return clusters
-    
-    def handle(self, *args, **options):
+
+    # Staged loader: charts are written into a new generation, invisible to readers until published
+
+    def stage_charts(self, charts_df: pd.DataFrame, countries: set[str], artist_ids: dict[tuple[str, str], int]) -> tuple[ChartGeneration, int]:
+        generation = ChartGeneration.objects.create()
+        Chart.objects.bulk_create(
+            [Chart(country_id=iso2, generation=generation) for iso2 in sorted(countries)],
+            batch_size=self.batch_size,
+        )
+        chart_ids = dict(Chart.objects.filter(generation=generation).values_list("country_id", "id"))
+
+        entries = []
+        for iso2, name, nationality, fields in self.chart_rows(charts_df):
+            if iso2 not in chart_ids:
+                continue
+            try:
+                artist_id = artist_ids[(name, nationality)]
+            except KeyError:
+                raise CommandError(f"Unknown artist in charts : {name} ({nationality})")
+            entries.append(ChartEntry(chart_id=chart_ids[iso2], artist_id=artist_id, **fields))
+        ChartEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+        return generation, len(entries)
+
+    # Incremental loaders: rows are diffed against the database by natural key.
+    # With prune=False rows missing from the datasets are kept, so that a
+    # staged load can delete them only once the new charts are published.
+
+    def delete_ids(self, model, ids) -> int:
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            model.objects.filter(pk__in=ids[start:start + self.batch_size]).delete()
+        return len(ids)
+
+    def sync_countries(self, countries_df: pd.DataFrame, prune=True) -> set[str]:
+        incoming = {
+            iso2: (float(internet_users), int(population))
+            for iso2, internet_users, population in zip(
+                countries_df["country_iso2"].to_numpy(),
+                countries_df["%_internet"].to_numpy(),
+                countries_df["population_total"].to_numpy(),
+            )
+        }
+        current = {
+            iso2: (internet_users, population)
+            for iso2, internet_users, population in Country.objects.values_list("iso2", "internet_users", "population")
+        }
+
+        created = [
+            Country(iso2=iso2, internet_users=values[0], population=values[1])
+            for iso2, values in incoming.items() if iso2 not in current
+        ]
+        updated = [
+            Country(iso2=iso2, internet_users=values[0], population=values[1])
+            for iso2, values in incoming.items() if iso2 in current and current[iso2] != values
+        ]
+        Country.objects.bulk_create(created, batch_size=self.batch_size)
+        Country.objects.bulk_update(updated, ["internet_users", "population"], batch_size=self.batch_size)
+        deleted = self.delete_ids(Country, current.keys() - incoming.keys()) if prune else 0
+
+        self.touched["countries"] = (len(created), len(updated), deleted)
+        return set(incoming)
+
+    def sync_artists(self, artists_df: pd.DataFrame, prune=True) -> dict[tuple[str, str], int]:
+        incoming = set(zip(artists_df["artistName"].to_numpy(), artists_df["artistCountry"].to_numpy()))
+        current = {
+            (name, nationality): artist_id
+            for artist_id, name, nationality in Artist.objects.values_list("id", "name", "nationality")
+        }
+
+        created = [Artist(name=name, nationality=nationality) for name, nationality in incoming - current.keys()]
+        Artist.objects.bulk_create(created, batch_size=self.batch_size)
+        deleted = self.delete_ids(Artist, [current[key] for key in current.keys() - incoming]) if prune else 0
+
+        self.touched["artists"] = (len(created), 0, deleted)
+        return {
+            (name, nationality): artist_id
+            for artist_id, name, nationality in Artist.objects.values_list("id", "name", "nationality")
+            if (name, nationality) in incoming
+        }
+
+    def sync_charts(self, charts_df: pd.DataFrame, countries: set[str], artist_ids: dict[tuple[str, str], int]) -> set[int]:
+        if (generation := ChartGeneration.current()) is None:
+            generation = ChartGeneration.objects.create()
+            generation.publish()
+        current_charts = set(Chart.objects.filter(generation=generation).values_list("country_id", flat=True))
+        new_charts = [Chart(country_id=iso2, generation=generation) for iso2 in sorted(countries - current_charts)]
+        Chart.objects.bulk_create(new_charts, batch_size=self.batch_size)
+        self.touched["charts"] = (len(new_charts), 0, 0)
+        chart_ids = dict(Chart.objects.filter(generation=generation).values_list("country_id", "id"))
+
+        incoming = {}
+        for iso2, name, nationality, fields in self.chart_rows(charts_df):
+            if iso2 not in chart_ids:
+                continue
+            try:
+                artist_id = artist_ids[(name, nationality)]
+            except KeyError:
+                raise CommandError(f"Unknown artist in charts : {name} ({nationality})")
+            incoming[(chart_ids[iso2], artist_id)] = fields
+
+        current = {
+            (chart_id, artist_id): (entry_id, dict(zip(self.entry_fields, values)))
+            for entry_id, chart_id, artist_id, *values in ChartEntry.objects.filter(chart__generation=generation).values_list(
+                "id", "chart_id", "artist_id", *self.entry_fields
+            )
+        }
+
+        created = [
+            ChartEntry(chart_id=chart_id, artist_id=artist_id, **fields)
+            for (chart_id, artist_id), fields in incoming.items() if (chart_id, artist_id) not in current
+        ]
+        updated_keys = [key for key, fields in incoming.items() if key in current and current[key][1] != fields]
+        updated = [ChartEntry(id=current[key][0], **incoming[key]) for key in updated_keys]
+        ChartEntry.objects.bulk_create(created, batch_size=self.batch_size)
+        ChartEntry.objects.bulk_update(updated, self.entry_fields, batch_size=self.batch_size)
+        deleted_keys = current.keys() - incoming.keys()
+        deleted = self.delete_ids(ChartEntry, [current[key][0] for key in deleted_keys])
+
+        self.touched["chart entries"] = (len(created), len(updated), deleted)
+        return (
+            {entry.artist_id for entry in created}
+            | {artist_id for _, artist_id in updated_keys}
+            | {artist_id for _, artist_id in deleted_keys}
+        )
+
+    def sync_clusters(self, clusters_df: pd.DataFrame, countries: set[str]) -> None:
+        incoming = {}
+        for iso2, cluster in zip(clusters_df["country_iso2"].to_numpy(), clusters_df["cluster"].to_numpy()):
+            if iso2 not in countries:
+                raise CommandError(f"Unknown country in clusters : {iso2}")
+            incoming[iso2] = self.cluster_choice(int(cluster))
+        current = {
+            iso2: (cluster_id, cluster)
+            for cluster_id, iso2, cluster in CountryCluster.objects.values_list("id", "country_id", "cluster")
+        }
+
+        created = [
+            CountryCluster(country_id=iso2, cluster=cluster)
+            for iso2, cluster in incoming.items() if iso2 not in current
+        ]
+        updated = [
+            CountryCluster(id=current[iso2][0], cluster=cluster)
+            for iso2, cluster in incoming.items() if iso2 in current and current[iso2][1] != cluster
+        ]
+        CountryCluster.objects.bulk_create(created, batch_size=self.batch_size)
+        CountryCluster.objects.bulk_update(updated, ["cluster"], batch_size=self.batch_size)
+        deleted = self.delete_ids(CountryCluster, [current[iso2][0] for iso2 in current.keys() - incoming.keys()])
+
+        self.touched["clusters"] = (len(created), len(updated), deleted)
+
+    def update_clusters(self, clusters_df: pd.DataFrame, countries: set[str]) -> None:
+        if self.compute_clusters:
+            # Warm started from the stored clusters, so a refresh only moves the countries whose charts shifted
+            self.touched["clusters"] = clustering.save_clusters(clustering.cluster_countries())
+        else:
+            self.sync_clusters(clusters_df, countries)
+
+    def report_touched(self):
+        for table, (created, updated, deleted) in self.touched.items():
+            self.stdout.write(f"{table:<14} +{created} ~{updated} -{deleted}")
+        total = sum(sum(counts) for counts in self.touched.values())
+        self.stdout.write(f"{total} rows touched")
+
+    def read_datasets(self) -> dict[str, pd.DataFrame]:
+        datasets = {}
+        for name in ("countries", "artists", "charts", "clusters"):
+            if (df := self.load_dataset(f"{name}.csv")) is None:
+                raise CommandError(f"Couldn't load dataset {name}")
+            datasets[name] = df
+        return datasets
+
+    def clear(self):
         CountryCluster.objects.all().delete()
         ChartEntry.objects.all().delete()
         Chart.objects.all().delete()
+        ChartGeneration.objects.all().delete()
         Artist.objects.all().delete()
         Country.objects.all().delete()
 
-        if (countries_df := self.load_dataset("countries.csv")) is not None:
-            self.load_countries(countries_df)
-        else:
-            raise CommandError("Couldn't load dataset countries")
-        
-        if (artists_df := self.load_dataset("artists.csv")) is not None:
-            self.load_artists(artists_df)
-        else:
-            raise CommandError("Couldn't load dataset artists")
-        
-        if (charts_df := self.load_dataset("charts.csv")) is not None:
-            self.load_charts(charts_df, countries_df)
-        else:
-            raise CommandError("Couldn't load dataset charts")
-        
-        if (clusters_df := self.load_dataset("clusters.csv")) is not None:
-            self.load_clusters(clusters_df)
-        else:
-            raise CommandError("Couldn't load dataset clusters")
+    def handle_legacy(self, datasets):
+        with self.timed("clear"):
+            self.clear()
+        with self.timed("countries"):
+            self.load_countries(datasets["countries"])
+        with self.timed("artists"):
+            self.load_artists(datasets["artists"])
+        with self.timed("charts"):
+            self.load_charts(datasets["charts"], datasets["countries"])
+        with self.timed("clusters"):
+            self.load_clusters(datasets["clusters"])
+        with self.timed("exports"):
+            exports.rebuild_export_potential()
+
+    def handle_bulk(self, datasets):
+        self.touched = {}
+        with self.timed("countries"), transaction.atomic():
+            countries = self.sync_countries(datasets["countries"], prune=False)
+        with self.timed("artists"), transaction.atomic():
+            artist_ids = self.sync_artists(datasets["artists"], prune=False)
+        with self.timed("charts"), transaction.atomic():
+            generation, nb_entries = self.stage_charts(datasets["charts"], countries, artist_ids)
+        # Readers switch to the new charts and to their export potential at once
+        with transaction.atomic():
+            with self.timed("publish"):
+                generation.publish()
+                cache.bump_data_version()
+            with self.timed("exports"):
+                exports.rebuild_export_potential()
+        with self.timed("cleanup"), transaction.atomic():
+            retired = ChartGeneration.collect_garbage(keep=self.keep_generations)
+            self.delete_ids(Country, set(Country.objects.values_list("iso2", flat=True)) - countries)
+            self.delete_ids(Artist, set(Artist.objects.values_list("id", flat=True)) - set(artist_ids.values()))
+        with self.timed("clusters"), transaction.atomic():
+            self.update_clusters(datasets["clusters"], countries)
+        self.stdout.write(
+            f"Published generation {generation.pk} with {len(countries)} countries, {len(artist_ids)} artists "
+            f"and {nb_entries} chart entries ({retired} old generations removed)"
+        )
+
+    def handle_incremental(self, datasets):
+        self.touched = {}
+        with transaction.atomic():
+            with self.timed("countries"):
+                countries = self.sync_countries(datasets["countries"])
+            with self.timed("artists"):
+                artist_ids = self.sync_artists(datasets["artists"])
+            with self.timed("charts"):
+                changed_artists = self.sync_charts(datasets["charts"], countries, artist_ids)
+            with self.timed("clusters"):
+                self.update_clusters(datasets["clusters"], countries)
+            with self.timed("exports"):
+                exports.refresh_artists_export_potential(changed_artists)
+        self.report_touched()
+
+    def handle(self, *args, **options):
+        self.timings = []
+        self.batch_size = options["batch_size"]
+        self.keep_generations = options["keep_generations"]
+        self.compute_clusters = options["compute_clusters"]
+
+        with self.timed("read"):
+            datasets = self.read_datasets()
+
+        if options["legacy"] and options["incremental"]:
+            raise CommandError("--legacy and --incremental are mutually exclusive")
+        if options["legacy"] and options["compute_clusters"]:
+            raise CommandError("--compute-clusters is not supported by the legacy loader")
+
+        # The export potential table and the data version are refreshed once per load instead of on every row write
+        with cache.suspend_versioning(), exports.suspend_sync():
+            if options["legacy"]:
+                self.handle_legacy(datasets)
+            elif options["incremental"]:
+                self.handle_incremental(datasets)
+            else:
+                self.handle_bulk(datasets)
+
+        # Reloads replace the charts, the snapshots keep their history
+        with self.timed("snapshots"):
+            snapshot_date = options["snapshot_date"] or date.today()
+            taken = history.take_snapshots(snapshot_date)
+            pruned = history.prune_snapshots(options["snapshot_retention"]) if options["snapshot_retention"] else 0
+        self.stdout.write(f"Took {taken} chart snapshots on {snapshot_date} ({pruned} expired snapshots removed)")
+
+        if replica.replica_enabled():
+            with self.timed("replica"):
+                replica.refresh_replica()
+
+        self.report_timings()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chartflow.replica import refresh_replica, replica_path
+
+
+class Command(BaseCommand):
+    help = "Copy the database onto the read replica (SQLITE_READ_REPLICA), as loaddata does after a load"
+
+    def handle(self, *args, **options):
+        if (elapsed := refresh_replica()) is None:
+            raise CommandError("No read replica configured, set SQLITE_READ_REPLICA")
+        self.stdout.write(self.style.SUCCESS(f"Replica {replica_path()} refreshed in {elapsed:.3f}s"))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves small bodies alone and keeps ETags strong.
+
+    Bodies shorter than CHARTFLOW_GZIP_MIN_LENGTH are not worth the CPU.
+    Django weakens the ETag of compressed responses; instead the compressed
+    representation gets its own strong tag, suffixed with `-gzip`, which
+    the conditional views map back to the original one."""
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < getattr(settings, 'CHARTFLOW_GZIP_MIN_LENGTH', 1024):
+            return response
+
+        etag = response.get('ETag')
+        response = super().process_response(request, response)
+        if etag and etag.startswith('"') and response.get('Content-Encoding') == 'gzip':
+            response.headers['ETag'] = f'{etag[:-1]}-gzip"'
+        return response
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-17 07:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def publish_existing_charts(apps, schema_editor):
+    Chart = apps.get_model('chartflow', 'Chart')
+    ChartGeneration = apps.get_model('chartflow', 'ChartGeneration')
+    if Chart.objects.filter(generation__isnull=True).exists():
+        generation = ChartGeneration.objects.create(status='CURRENT', published_at=timezone.now())
+        Chart.objects.filter(generation__isnull=True).update(generation=generation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chartflow', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('STAGING', 'Staging'), ('CURRENT', 'Current'), ('RETIRED', 'Retired')], default='STAGING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='chart',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='chart',
+            name='generation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='charts', to='chartflow.chartgeneration'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='chart',
+            unique_together={('country', 'generation')},
+        ),
+        migrations.RunPython(publish_existing_charts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-17 07:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def build_export_potential(apps, schema_editor):
+    ChartEntry = apps.get_model('chartflow', 'ChartEntry')
+    ExportPotential = apps.get_model('chartflow', 'ExportPotential')
+    entries = (
+        ChartEntry.objects.filter(chart__generation__status='CURRENT')
+        .exclude(chart__country=F('artist__nationality'))
+        .values_list('artist_id', 'chart__country_id', 'artist__nationality', 'rank')
+    )
+    ExportPotential.objects.bulk_create(
+        [
+            ExportPotential(artist_id=artist_id, country_id=country_id, nationality=nationality, rank=rank)
+            for artist_id, country_id, nationality, rank in entries
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chartflow', '0002_chart_generations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportPotential',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nationality', models.CharField(max_length=2)),
+                ('rank', models.IntegerField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_potentials', to='chartflow.artist')),
+                ('country', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_potentials', to='chartflow.country')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['nationality', 'country', 'rank'], name='chartflow_e_nationa_e4d5fa_idx')],
+                'unique_together': {('artist', 'country')},
+            },
+        ),
+        migrations.RunPython(build_export_potential, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-17 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chartflow', '0004_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chartentry',
+            name='appearances',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chartentry',
+            name='consecutive_appearances',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chartentry',
+            name='entry_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chartentry',
+            name='peak_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chartentry',
+            name='peak_rank',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ChartSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(max_length=2)),
+                ('date', models.DateField()),
+                ('artist_ids', models.BinaryField()),
+                ('ranks', models.BinaryField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='chartflow_c_date_dec0dd_idx')],
+                'unique_together': {('country', 'date')},
+            },
+        ),
+    ]
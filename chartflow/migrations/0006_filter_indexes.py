@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-17 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chartflow', '0005_chart_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['nationality'], name='chartflow_a_nationa_595ff4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chartentry',
+            index=models.Index(fields=['chart', 'rank'], name='chartflow_c_chart_i_d7f744_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+import numpy as np
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import EmailValidator
 
@@ -39,6 +41,22 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+class TokenUser(User):
+    """A user rebuilt from the claims of an access token by
+    chartflow.authentication, without a query. The fields missing from the
+    token are deferred and loaded together, from the process user cache,
+    the first time one of them is read."""
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        from .authentication import cached_user
+
+        user = cached_user(self.pk)
+        for attname in self.get_deferred_fields():
+            setattr(self, attname, getattr(user, attname))
+
 class Artist(models.Model):
     name = models.CharField(max_length=100)
     user = models.OneToOneField(User, on_delete=models.SET_NULL, related_name='artist_profile', null=True, blank=True)
@@ -46,25 +64,87 @@ class Artist(models.Model):
                               related_name='managed_artists', limit_choices_to={'role': 'manager'})
     nationality = models.CharField(max_length=2)
 
+    class Meta:
+        indexes = [models.Index(fields=['nationality'])]
+
     def __str__(self):
         return self.name
 
+class ChartGeneration(models.Model):
+    class StatusChoices(models.TextChoices):
+        STAGING = 'STAGING', 'Staging'
+        CURRENT = 'CURRENT', 'Current'
+        RETIRED = 'RETIRED', 'Retired'
+
+    status = models.CharField(max_length=20, choices=StatusChoices.choices, default=StatusChoices.STAGING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(status=cls.StatusChoices.CURRENT).first()
+
+    def publish(self):
+        # Readers filter on the CURRENT status, so flipping it inside one
+        # transaction swaps every chart at once
+        with transaction.atomic():
+            ChartGeneration.objects.filter(status=self.StatusChoices.CURRENT).exclude(pk=self.pk).update(
+                status=self.StatusChoices.RETIRED
+            )
+            self.status = self.StatusChoices.CURRENT
+            self.published_at = timezone.now()
+            self.save(update_fields=['status', 'published_at'])
+
+    @classmethod
+    def collect_garbage(cls, keep=0) -> int:
+        retired = cls.objects.filter(status=cls.StatusChoices.RETIRED).order_by('-published_at', '-id')
+        stale = list(retired.values_list('id', flat=True)[keep:])
+        if (current := cls.current()) is not None:
+            # Staging generations older than the published one come from aborted loads
+            stale += cls.objects.filter(status=cls.StatusChoices.STAGING, pk__lt=current.pk).values_list('id', flat=True)
+        cls.objects.filter(pk__in=stale).delete()
+        return len(stale)
+
+    def __str__(self):
+        return f"Generation {self.pk} ({self.status})"
+
+class ChartQuerySet(models.QuerySet):
+    def current(self):
+        return self.filter(generation__status=ChartGeneration.StatusChoices.CURRENT)
+
 class Chart(models.Model):
     country = models.ForeignKey(Country, on_delete=models.CASCADE, related_name='charts')
-    
+    generation = models.ForeignKey(ChartGeneration, on_delete=models.CASCADE, related_name='charts', null=True)
+
+    objects = ChartQuerySet.as_manager()
+
     class Meta:
-        unique_together = ['country']
+        unique_together = ['country', 'generation']
 
     def __str__(self):
         return f"Chart for {self.country.iso2}"
 
+class ChartEntryQuerySet(models.QuerySet):
+    def current(self):
+        return self.filter(chart__generation__status=ChartGeneration.StatusChoices.CURRENT)
+
 class ChartEntry(models.Model):
     chart = models.ForeignKey(Chart, on_delete=models.CASCADE, related_name='entries')
     artist = models.ForeignKey(Artist, to_field="id",on_delete=models.CASCADE, related_name='chart_entries')
     rank = models.IntegerField()
+    # Chart history as published with the chart, null for entries loaded before they were
+    peak_rank = models.IntegerField(null=True, blank=True)
+    peak_date = models.DateField(null=True, blank=True)
+    appearances = models.IntegerField(null=True, blank=True)
+    consecutive_appearances = models.IntegerField(null=True, blank=True)
+    entry_rank = models.IntegerField(null=True, blank=True)
+
+    objects = ChartEntryQuerySet.as_manager()
 
     class Meta:
         unique_together = ['chart', 'artist']
+        # Rank ranges and top-N scan each chart in rank order
+        indexes = [models.Index(fields=['chart', 'rank'])]
 
     def __str__(self):
         return f"{self.artist.name} at rank {self.rank} in {self.chart.country.iso2}"
@@ -79,3 +159,60 @@ class CountryCluster(models.Model):
 
     def __str__(self):
         return f"{self.country.iso2} - {self.cluster}"
+
+class ExportPotential(models.Model):
+    """Best rank of an artist in each foreign chart, denormalized with the
+    artist nationality so export potential is one indexed lookup."""
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='export_potentials')
+    country = models.ForeignKey(Country, on_delete=models.CASCADE, related_name='export_potentials')
+    nationality = models.CharField(max_length=2)
+    rank = models.IntegerField()
+
+    class Meta:
+        unique_together = ['artist', 'country']
+        indexes = [models.Index(fields=['nationality', 'country', 'rank'])]
+
+    def __str__(self):
+        return f"{self.artist.name} at rank {self.rank} in {self.country.iso2}"
+
+class DataVersion(models.Model):
+    """Single row counter bumped on every write to the chart data, used to
+    invalidate cached responses across processes."""
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Data version {self.version}"
+
+class ChartSnapshot(models.Model):
+    """A country's chart as loaded on `date`, kept after the chart itself is replaced.
+
+    Append-only and compact: one row per chart and date, the entries packed
+    in rank order as little-endian arrays (artist ids as int32, ranks as uint16)."""
+    id_dtype = '<i4'
+    rank_dtype = '<u2'
+
+    # Not a foreign key: history outlives the countries dropped by a reload
+    country = models.CharField(max_length=2)
+    date = models.DateField()
+    artist_ids = models.BinaryField()
+    ranks = models.BinaryField()
+
+    class Meta:
+        unique_together = ['country', 'date']
+        # Trajectories read every country over a date range
+        indexes = [models.Index(fields=['date'])]
+
+    @classmethod
+    def pack(cls, country, date, entries):
+        """Snapshot of (artist id, rank) entries."""
+        entries = sorted(entries, key=lambda entry: entry[1])
+        artist_ids = np.array([artist_id for artist_id, _ in entries], dtype=cls.id_dtype)
+        ranks = np.array([rank for _, rank in entries], dtype=cls.rank_dtype)
+        return cls(country=country, date=date, artist_ids=artist_ids.tobytes(), ranks=ranks.tobytes())
+
+    def unpack(self):
+        """(artist ids, ranks) arrays, by rank."""
+        return np.frombuffer(self.artist_ids, dtype=self.id_dtype), np.frombuffer(self.ranks, dtype=self.rank_dtype)
+
+    def __str__(self):
+        return f"Chart snapshot for {self.country} on {self.date}"
@@ -1,5 +1,48 @@
+from dataclasses import dataclass
+
 from rest_framework.permissions import BasePermission
 
+from .models import Artist
+
+
+@dataclass(frozen=True)
+class CallerScope:
+    """The artists a caller may read: its own profile, or those it manages."""
+    artist_id: int | None = None
+    managed_artist_ids: frozenset = frozenset()
+
+
+def resolve_scope(user) -> CallerScope:
+    # Users authenticated from their token carry their scope (chartflow.authentication),
+    # their artist profile is a stub that does not need a query
+    if user.role == "artist":
+        try:
+            return CallerScope(artist_id=user.artist_profile.pk)
+        except Artist.DoesNotExist:
+            return CallerScope()
+    if user.role == "manager":
+        if (managed := getattr(user, "managed_artist_ids", None)) is None:
+            managed = frozenset(Artist.objects.filter(manager_id=user.pk).values_list("id", flat=True))
+        return CallerScope(managed_artist_ids=managed)
+    return CallerScope()
+
+
+def caller_scope(request) -> CallerScope:
+    """The scope of the caller, resolved once per request."""
+    if (scope := getattr(request, "_caller_scope", None)) is None:
+        scope = request._caller_scope = resolve_scope(request.user)
+    return scope
+
+
+def scope_artists(request, queryset):
+    """Narrows an Artist queryset to the caller's scope, in SQL."""
+    if request.user.role == "manager":
+        return queryset.filter(manager_id=request.user.pk)
+    if request.user.role == "artist":
+        return queryset.filter(user_id=request.user.pk)
+    return queryset
+
+
 class UserViewPermissions(BasePermission):
     def has_permission(self, request, view):
         if view.action in ["retrieve", "partial_update", "me"]:
@@ -15,38 +58,38 @@ class UserViewPermissions(BasePermission):
 
 class ArtistViewPermissions(BasePermission):
     def has_permission(self, request, view):
-        if view.action in ["retrieve", "partial_update", "performance", "nationalities", "list"]:
+        if view.action in ["retrieve", "partial_update", "performance", "trajectory", "nationalities", "list", "me"]:
             return True
         
         return False
         
     def has_object_permission(self, request, view, obj):
-        if view.action in ["retrieve", "performance"]:
+        if view.action in ["retrieve", "performance", "trajectory"]:
             if request.user.role == "artist":
-                return obj == request.user.artist_profile
+                return obj.pk == caller_scope(request).artist_id
             elif request.user.role == "manager":
-                return obj in request.user.managed_artists.all()
+                return obj.pk in caller_scope(request).managed_artist_ids
         elif view.action == "partial_update":
             if request.user.role == "artist":
-                return obj == request.user.artist_profile
+                return obj.pk == caller_scope(request).artist_id
         return False
 
 class CountryViewPermissions(BasePermission):
     def has_permission(self, request, view):
-        if request.user.role in ["admin","manager"] and view.action in ["list", "retrieve"]:
+        if request.user.role in ["admin","manager"] and view.action in ["list", "retrieve", "similar"]:
             return True
         
         return False
         
     def has_object_permission(self, request, view, obj):
-        if view.action == "retrieve":
+        if view.action in ["retrieve", "similar"]:
             return True
         
         return False
 
 class ChartViewPermissions(BasePermission):
     def has_permission(self, request, view):
-        if view.action in ["list", "retrieve", "countries", "by_country"]:
+        if view.action in ["list", "retrieve", "countries", "by_country", "movers"]:
             return True
         
         return False
@@ -59,7 +102,7 @@ class ChartViewPermissions(BasePermission):
 
 class ChartEntryViewPermissions(BasePermission):
     def has_permission(self, request, view):
-        if view.action in ["list", "retrieve"]:
+        if view.action in ["list", "retrieve", "export"]:
             return True
         
         return False
@@ -0,0 +1,150 @@
+"""Fast read path for the hot list endpoints.
+
+Readers project rows with values_list() and shape them into the exact JSON
+contract of the matching serializers, without building model instances or
+serializer field trees. Keep them in sync with chartflow/serializers.py;
+the parity tests compare both paths byte for byte.
+
+Artists and countries are packed as pre-encoded fragments when the default
+renderer splices them into the response (see chartflow/renderers.py)."""
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from rest_framework.response import Response
+
+from .models import ChartEntry
+from .renderers import fragment_packer
+
+artist_columns = ('artist_id', 'artist__name', 'artist__manager__username', 'artist__nationality')
+
+
+def artist(artist_id, name, manager_name, nationality) -> dict:
+    # ArtistSerializer
+    return {'id': artist_id, 'name': name, 'manager_name': manager_name, 'nationality': nationality}
+
+
+def country(iso2, internet_users, population) -> dict:
+    # CountrySerializer
+    return {'iso2': iso2, 'internet_users': internet_users, 'population': population}
+
+
+class ArtistReader:
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values_list('id', 'name', 'manager__username', 'nationality', named=True)
+
+    def shape(self, rows, pack=None) -> list[dict]:
+        pack = pack or fragment_packer()
+        return [pack(artist(row.id, row.name, row.manager__username, row.nationality)) for row in rows]
+
+
+class ChartEntryReader:
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values_list('id', *artist_columns, 'rank', 'chart__country', named=True)
+
+    def shape(self, rows, pack=None) -> list[dict]:
+        pack = pack or fragment_packer()
+        # ChartEntrySerializer
+        return [
+            {
+                'id': row.id,
+                'artist': pack(artist(row.artist_id, row.artist__name, row.artist__manager__username, row.artist__nationality)),
+                'rank': row.rank,
+                'country': row.chart__country,
+            }
+            for row in rows
+        ]
+
+
+class ChartReader:
+    def values(self, queryset):
+        return queryset.prefetch_related(None).values_list(
+            'id', 'country__iso2', 'country__internet_users', 'country__population', named=True
+        )
+
+    def entry_values(self, rows, entries=None):
+        """`entries` is the chart entry queryset to list, all of them by default."""
+        return (
+            (ChartEntry.objects.all() if entries is None else entries)
+            .filter(chart__in=[row.id for row in rows])
+            .order_by('id')
+            .values_list('id', 'chart_id', *artist_columns, 'rank', 'chart__country')
+        )
+
+    def shape(self, rows, pack=None, entries=None) -> list[dict]:
+        rows = list(rows)
+        return self.assemble(rows, self.entry_values(rows, entries), pack)
+
+    def assemble(self, rows, entry_rows, pack=None) -> list[dict]:
+        """Charts `rows` with their `entry_rows` (see `entry_values`)."""
+        pack = pack or fragment_packer()
+        listed = defaultdict(list)
+        for entry_id, chart_id, artist_id, name, manager_name, nationality, rank, iso2 in entry_rows:
+            listed[chart_id].append({
+                'id': entry_id,
+                'artist': pack(artist(artist_id, name, manager_name, nationality)),
+                'rank': rank,
+                'country': iso2,
+            })
+
+        # ChartSerializer
+        return [
+            {
+                'id': row.id,
+                'country': pack(country(row.country__iso2, row.country__internet_users, row.country__population)),
+                'entries': listed[row.id],
+            }
+            for row in rows
+        ]
+
+
+@contextmanager
+def read_snapshot(model):
+    """Runs the block's reads of `model` in one transaction, so that queries
+    made one after the other (the charts, then their entries) see the same
+    data even when a load publishes a generation and deletes the old one in
+    between.
+
+    atomic() begins with the connection's transaction_mode, IMMEDIATE (a
+    write lock) under the performance profile; reads only need the plain
+    deferred BEGIN."""
+    connection = connections[router.db_for_read(model)]
+    if connection.in_atomic_block:
+        yield
+        return
+    connection.ensure_connection()
+    mode = getattr(connection, 'transaction_mode', None)
+    connection.transaction_mode = None
+    try:
+        with transaction.atomic(using=connection.alias):
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def fast_reads_enabled(request) -> bool:
+    # Sparse fieldsets go through the serializers, which know how to prune
+    return getattr(settings, 'CHARTFLOW_FAST_READS', False) and not request.query_params.get('fields')
+
+
+class FastReadMixin:
+    """Serves `list` through `reader` when CHARTFLOW_FAST_READS is enabled."""
+    reader = None
+
+    def shape(self, rows):
+        return self.reader.shape(rows)
+
+    def fast_list(self, queryset):
+        values = self.reader.values(queryset)
+        page = self.paginate_queryset(values)
+        if page is None:
+            return self.shape(values), False
+        return self.shape(page), True
+
+    def list(self, request, *args, **kwargs):
+        if self.reader is None or not fast_reads_enabled(request):
+            return super().list(request, *args, **kwargs)
+
+        data, paginated = self.fast_list(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(data) if paginated else Response(data)
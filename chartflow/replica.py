@@ -0,0 +1,109 @@
+"""Read-only SQLite replica for the chart read endpoints.
+
+The replica is a copy of the database file, written with SQLite's online
+backup API by `refresh_replica` after every ingest (loaddata, createusers,
+`python manage.py refreshreplica`). While loaddata rewrites the primary,
+the read endpoints keep answering from the previous copy.
+
+Only the reads of the chart data models go to the replica, and only inside
+`replica_reads()`, entered by the read endpoints. Users, tokens and every
+write stay on the primary. Edits made through the API to those models
+(an artist's profile) reach the replica with the next refresh."""
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.transaction import TransactionManagementError
+
+replica_alias = 'replica'
+replicated_models = {
+    'country', 'artist', 'chartgeneration', 'chart', 'chartentry', 'countrycluster',
+    'exportpotential', 'chartsnapshot', 'dataversion',
+}
+_replica_reads = ContextVar('chartflow_replica_reads', default=False)
+
+
+def replica_enabled() -> bool:
+    return replica_alias in settings.DATABASES
+
+
+def replica_path() -> Path:
+    return Path(settings.DATABASES[replica_alias]['NAME'])
+
+
+@contextmanager
+def replica_reads():
+    """Sends the reads of the block to the replica. A context variable, so it
+    follows the ORM calls that the async views hand over to threads."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    # Set once the replica file exists, so that a fresh deployment reads the primary until the first refresh
+    replica_ready = False
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or model._meta.app_label != 'chartflow' or model._meta.model_name not in replicated_models:
+            return None
+        if not replica_enabled():
+            return None
+        if not self.replica_ready:
+            if not replica_path().exists():
+                return None
+            ReadReplicaRouter.replica_ready = True
+        return replica_alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema with the copy
+        return db != replica_alias
+
+
+class ReplicaReadMixin:
+    """Serves the safe requests of a viewset from the replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+def refresh_replica(using=DEFAULT_DB_ALIAS) -> float | None:
+    """Copies the `using` database onto the replica file. Seconds taken, or
+    None without a replica configured.
+
+    The copy runs in one step, so readers of the replica wait on its lock
+    (the `timeout` option) rather than seeing a partial copy, and their
+    persistent connections see the new content at their next query. SQLite
+    cannot back up a database its own connection is writing to, so the copy
+    is refused inside a transaction."""
+    if not replica_enabled():
+        return None
+    if connections[using].in_atomic_block:
+        raise TransactionManagementError("The replica cannot be refreshed inside a transaction")
+    start = perf_counter()
+    source = connections[using]
+    source.ensure_connection()
+    replica_path().parent.mkdir(parents=True, exist_ok=True)
+    target = sqlite3.connect(replica_path(), timeout=settings.DATABASES[replica_alias].get('OPTIONS', {}).get('timeout', 5))
+    try:
+        source.connection.backup(target)
+    finally:
+        target.close()
+    ReadReplicaRouter.replica_ready = True
+    return perf_counter() - start
@@ -4,13 +4,117 @@ from rest_framework import serializers
 from rest_framework.fields import IntegerField
 from .models import User, Artist, Country, Chart, ChartEntry, CountryCluster
 
-class CountrySerializer(serializers.ModelSerializer):
+
+def parse_field_paths(value: str | None) -> dict | None:
+    """'rank,artist.name,artist.id' -> {'rank': {}, 'artist': {'name': {}, 'id': {}}}"""
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, path.strip().split('.')):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class SparseFieldsetMixin:
+    """Renders only the fields requested with `?fields=` (dotted paths reach
+    into nested serializers).
+
+    A nested object requested without sub-fields is rendered as its primary
+    key, unless it is listed in `?expand=`. Without `?fields=` the output is
+    unchanged. `get_query_plan` tells the viewset which columns and joins
+    the remaining fields need.
+
+    `sparse_requirements` maps method fields to the ORM paths they read."""
+    sparse_requirements = {}
+
+    def get_sparse_spec(self):
+        if hasattr(self, '_sparse_spec'):
+            return self._sparse_spec
+        root = self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None)
+        request = self.context.get('request')
+        if not root or request is None or request.method != 'GET':
+            return None, None
+        return parse_field_paths(request.query_params.get('fields')), parse_field_paths(request.query_params.get('expand')) or {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        spec, expand = self.get_sparse_spec()
+        if spec is None:
+            return fields
+
+        pruned = {}
+        for name, field in fields.items():
+            if field.write_only:
+                pruned[name] = field
+            elif name in spec:
+                pruned[name] = self.sparse_field(name, field, spec[name], expand.get(name))
+        return pruned
+
+    def sparse_field(self, name, field, spec, expand):
+        many = isinstance(field, serializers.ListSerializer)
+        nested = field.child if many else field
+        if not isinstance(nested, serializers.BaseSerializer):
+            return field
+        if spec:
+            nested._sparse_spec = (spec, expand or {})
+            return field
+        if expand is not None:
+            nested._sparse_spec = (None, None)
+            return field
+        kwargs = {'source': field.source} if field.source else {}
+        return serializers.PrimaryKeyRelatedField(read_only=True, allow_null=True, many=many, **kwargs)
+
+    def get_query_plan(self, prefix=''):
+        """(columns for only() or None when unknown, paths for select_related, fields rendered as nested objects)"""
+        only, related, nested = set(), set(), set()
+        model = self.Meta.model
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            if isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+                nested.add(name)
+            elif isinstance(field, serializers.BaseSerializer):
+                nested.add(name)
+                related.add(prefix + source)
+                if isinstance(field, SparseFieldsetMixin):
+                    child_only, child_related, _ = field.get_query_plan(f"{prefix}{source}__")
+                    related |= child_related
+                    only = None if only is None or child_only is None else only | child_only
+                elif only is not None:
+                    only.add(prefix + source)
+            elif isinstance(field, serializers.SerializerMethodField):
+                if (paths := self.sparse_requirements.get(name)) is None:
+                    only = None
+                    continue
+                for path in paths:
+                    parts = path.split('__')
+                    related |= {prefix + '__'.join(parts[:i]) for i in range(1, len(parts))}
+                    if only is not None:
+                        only.add(prefix + path)
+            elif source == '*' or '.' in source:
+                only = None
+            elif isinstance(field, serializers.PrimaryKeyRelatedField) and not model._meta.get_field(source).concrete:
+                related_model = model._meta.get_field(source).related_model
+                related.add(prefix + source)
+                if only is not None:
+                    only.add(f"{prefix}{source}__{related_model._meta.pk.name}")
+            elif only is not None:
+                only.add(prefix + source)
+        return only, related, nested
+
+
+class CountrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Country
         fields = ['iso2', 'internet_users', 'population']
 
-class ArtistSerializer(serializers.ModelSerializer):
+class ArtistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     manager_name = serializers.SerializerMethodField(read_only=True)
+    sparse_requirements = {'manager_name': ['manager__username']}
+
     class Meta:
         model = Artist
         fields = ['id', 'user', 'name', 'manager', 'manager_name', 'nationality']
@@ -24,13 +128,13 @@ class ArtistSerializer(serializers.ModelSerializer):
             return obj.manager.username
         return None
 
-class AdminArtistSerializer(serializers.ModelSerializer):
+class AdminArtistSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Artist
         fields = ['id', 'user', 'name', 'manager', 'nationality']
         depth = 1
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     artist_id = IntegerField(write_only=True, required=False)
     artist_profile = ArtistSerializer(read_only=True)
     class Meta:
@@ -89,9 +193,10 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class ChartEntrySerializer(serializers.ModelSerializer):
+class ChartEntrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     artist = ArtistSerializer(read_only=True)
     country = serializers.SerializerMethodField(read_only=True)
+    sparse_requirements = {'country': ['chart__country__iso2']}
     
     class Meta:
         model = ChartEntry
@@ -100,7 +205,7 @@ class ChartEntrySerializer(serializers.ModelSerializer):
     def get_country(self, obj):
         return getattr(getattr(obj.chart, 'country', None), 'iso2', None)
 
-class ChartSerializer(serializers.ModelSerializer):
+class ChartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     country = CountrySerializer()
     entries = ChartEntrySerializer(many=True, read_only=True)
 
@@ -108,7 +213,7 @@ class ChartSerializer(serializers.ModelSerializer):
         model = Chart
         fields = ['id', 'country', 'entries']
 
-class CountryClusterSerializer(serializers.ModelSerializer):
+class CountryClusterSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     country = CountrySerializer()
 
     class Meta:
@@ -0,0 +1,66 @@
+import csv
+import json
+
+from django.forms import ValidationError
+from django.http import StreamingHttpResponse
+
+from .replica import replica_reads
+
+columns = ['id', 'country', 'rank', 'artist_id', 'artist_name', 'artist_nationality']
+lookups = ['id', 'chart__country', 'rank', 'artist_id', 'artist__name', 'artist__nationality']
+chunk_size = 2000
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def rows(queryset):
+    # The rows are read while the response is streamed, after the view and its
+    # replica_reads() have returned: the block is entered again here
+    with replica_reads():
+        # iterator() fetches the rows chunk by chunk instead of caching the whole result
+        yield from queryset.order_by('id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def jsonl_lines(queryset):
+    lines = []
+    for row in rows(queryset):
+        lines.append(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def csv_lines(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    lines = []
+    for row in rows(queryset):
+        lines.append(writer.writerow(row))
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+formats = {
+    'jsonl': (jsonl_lines, 'application/x-ndjson', 'jsonl'),
+    'csv': (csv_lines, 'text/csv', 'csv'),
+}
+
+
+def stream_entries(queryset, output) -> StreamingHttpResponse:
+    try:
+        generator, content_type, extension = formats[output]
+    except KeyError:
+        raise ValidationError(f"Unknown output format : {output}")
+    response = StreamingHttpResponse(generator(queryset), content_type=f"{content_type}; charset=utf-8")
+    response['Content-Disposition'] = f'attachment; filename="chart-entries.{extension}"'
+    return response
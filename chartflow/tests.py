@@ -1,3 +1,1143 @@
-from django.test import TestCase
+import json
+import sqlite3
+import tempfile
+import warnings
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.transaction import TransactionManagementError
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import analytics, authentication, clustering, exports, hashing, history, renderers, replica
+from .blacklist import BloomFilter, blacklist_filter
+from .permissions import ArtistViewPermissions, caller_scope
+from .replica import ReadReplicaRouter, refresh_replica, replica_reads
+from .cache import response_cache
+from .exports import rebuild_export_potential
+from .management.commands import loaddata
+from .models import Artist, Chart, ChartEntry, ChartGeneration, ChartSnapshot, Country, CountryCluster, ExportPotential, User
+from .views import ExportAnalysisViewSet
+
+
+class ChartDataMixin:
+    """Small but not trivial dataset: N+1 patterns show up as query counts growing with it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", email="admin@gmail.com", password="password", role="admin", is_staff=True)
+        cls.manager = User.objects.create_user(username="manager1", email="manager1@gmail.com", password="password", role="manager")
+        cls.artist_user = User.objects.create_user(username="artist.1.1", email="artist.1.1@gmail.com", password="password", role="artist")
+
+        cls.countries = Country.objects.bulk_create([
+            Country(iso2=iso2, internet_users=90.0, population=1000000) for iso2 in ["FR", "US", "DE", "BR"]
+        ])
+        CountryCluster.objects.bulk_create([
+            CountryCluster(country=country, cluster=CountryCluster.ClusterChoices.MATURE) for country in cls.countries
+        ])
+
+        cls.artists = Artist.objects.bulk_create([
+            Artist(name=f"Artist {nationality} {i}", nationality=nationality, manager=cls.manager)
+            for nationality in ["FR", "US", "DE"] for i in range(4)
+        ])
+        cls.artist = cls.artists[0]
+        cls.artist.user = cls.artist_user
+        cls.artist.save()
+
+        generation = ChartGeneration.objects.create()
+        generation.publish()
+        charts = Chart.objects.bulk_create([Chart(country=country, generation=generation) for country in cls.countries])
+        ChartEntry.objects.bulk_create([
+            ChartEntry(chart=chart, artist=artist, rank=rank + 1)
+            for chart in charts for rank, artist in enumerate(cls.artists[1:])
+        ])
+        cls.chart = charts[0]
+        rebuild_export_potential()
+
+    def setUp(self):
+        self.client = APIClient()
+        response_cache().clear()
+        analytics.clear()
+        authentication.clear()
+        blacklist_filter.reset()
+
+    def login(self, user):
+        self.client.force_authenticate(user)
+
+
+class QueryCountTest(ChartDataMixin, TestCase):
+    """Pins the number of queries of every read endpoint so that N+1 regressions fail.
+
+    Conditional and cached endpoints pay one extra query to read the data version."""
+
+    def assertQueries(self, user, url, num):
+        self.login(user)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_users(self):
+        self.assertQueries(self.admin, "/users/", 2)
+        self.assertQueries(self.admin, f"/users/{self.artist_user.pk}/", 2)
+        self.assertQueries(self.artist_user, "/users/me/", 1)
+
+    def test_artists(self):
+        self.assertQueries(self.admin, "/artists/", 6)
+        self.assertQueries(self.manager, "/artists/", 2)
+        self.assertQueries(self.admin, f"/artists/{self.artist.pk}/", 2)
+        self.assertQueries(self.artist_user, f"/artists/{self.artist.pk}/", 2)
+        self.assertQueries(self.artist_user, "/artists/me/", 1)
+        self.assertQueries(self.admin, "/artists/nationalities/", 1)
+
+    def test_artist_performance(self):
+        self.assertQueries(self.admin, f"/artists/{self.artists[1].pk}/performance/", 2)
+
+    def test_countries(self):
+        self.assertQueries(self.admin, "/countries/", 2)
+        self.assertQueries(self.admin, "/countries/FR/", 2)
+
+    def test_charts(self):
+        response = self.assertQueries(self.admin, "/charts/", 3)
+        self.assertEqual(len(response.json()["results"]), len(self.countries))
+        self.assertQueries(self.admin, f"/charts/{self.chart.pk}/", 3)
+        self.assertQueries(self.admin, "/charts/?country=FR", 3)
+        self.assertQueries(self.admin, "/charts/countries/", 1)
+
+    def test_chart_entries(self):
+        self.assertQueries(self.admin, "/chart-entries/", 2)
+        self.assertQueries(self.admin, f"/chart-entries/{self.chart.entries.first().pk}/", 2)
+
+    def test_country_clusters(self):
+        self.assertQueries(self.admin, "/country-clusters/", 2)
+        self.assertQueries(self.admin, f"/country-clusters/{CountryCluster.objects.first().pk}/", 2)
+
+    def test_history(self):
+        history.take_snapshots(date(2026, 1, 1))
+        history.take_snapshots(date(2026, 1, 8))
+        self.assertQueries(self.manager, f"/artists/{self.artists[1].pk}/trajectory/?from=2025-12-01&to=2026-02-01", 3)
+        self.assertQueries(self.admin, "/charts/movers/?country=FR&from=2026-01-01&to=2026-01-08", 3)
+
+    def test_chart_entry_export(self):
+        # The rows are read while the response is streamed
+        self.login(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get("/chart-entries/export/?country=FR")
+            content = b"".join(response.streaming_content)
+        self.assertEqual(len(content.splitlines()), len(self.artists) - 1)
+
+    def test_cached_responses(self):
+        first = self.assertQueries(self.admin, "/charts/", 3)
+        second = self.assertQueries(self.admin, "/charts/", 1)
+        self.assertEqual(first.json(), second.json())
+
+        # writes bump the data version, so the next read misses
+        ChartEntry.objects.filter(chart=self.chart).update(rank=1)
+        self.chart.entries.first().save()
+        third = self.assertQueries(self.admin, "/charts/", 3)
+        self.assertNotEqual(first.json(), third.json())
+        stats = self.client.get("/cache-stats/").json()
+        self.assertEqual((stats["hits"], stats["max_entries"]), (1, settings.CACHES["responses"]["OPTIONS"]["MAX_ENTRIES"]))
+
+    def test_export_potential(self):
+        self.assertQueries(self.admin, f"/export-analysis/potential/{self.artist.pk}/", 2)
+        self.assertQueries(self.manager, "/export-analysis/potential/", 3)
+        self.assertQueries(self.admin, "/export-analysis/potential/", 3)
+        ids = ",".join(str(artist.pk) for artist in self.artists)
+        self.assertQueries(self.admin, f"/export-analysis/potential/?artists={ids}", 3)
+
+
+class ConditionalGetTest(ChartDataMixin, TestCase):
+    def test_not_modified(self):
+        self.login(self.admin)
+        response = self.client.get("/charts/")
+        etag = response["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/charts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        self.chart.entries.first().save()
+        response = self.client.get("/charts/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_is_scoped_to_the_caller(self):
+        self.login(self.manager)
+        etag = self.client.get("/artists/")["ETag"]
+        self.login(self.admin)
+        self.assertEqual(self.client.get("/artists/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_gzip(self):
+        self.login(self.admin)
+        response = self.client.get("/charts/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(response["ETag"].endswith('-gzip"'))
+        response = self.client.get("/charts/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/countries/FR/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", response)
+
+
+class PaginationTest(ChartDataMixin, TestCase):
+    def test_walk_pages(self):
+        self.login(self.admin)
+        ids, url = [], "/chart-entries/?page_size=5"
+        while url:
+            with self.assertNumQueries(2):
+                page = self.client.get(url).json()
+            ids += [entry["id"] for entry in page["results"]]
+            url = page["next"]
+        self.assertEqual(ids, list(ChartEntry.objects.order_by("id").values_list("id", flat=True)))
+
+
+class SparseFieldsetTest(ChartDataMixin, TestCase):
+    def test_prunes_fields_and_columns(self):
+        self.login(self.admin)
+        with self.assertNumQueries(2) as context:
+            response = self.client.get("/chart-entries/?fields=rank,country")
+        self.assertEqual(set(response.json()["results"][0]), {"rank", "country"})
+        self.assertNotIn("chartflow_artist", context.captured_queries[-1]["sql"])
+
+    def test_nested_objects_collapse_to_their_key_unless_expanded(self):
+        self.login(self.admin)
+        entry = self.client.get("/chart-entries/?fields=id,artist").json()["results"][0]
+        self.assertIsInstance(entry["artist"], int)
+        entry = self.client.get("/chart-entries/?fields=id,artist&expand=artist").json()["results"][0]
+        self.assertEqual(set(entry["artist"]), {"id", "name", "manager_name", "nationality"})
+        entry = self.client.get("/chart-entries/?fields=id,artist.name").json()["results"][0]
+        self.assertEqual(entry["artist"], {"name": ChartEntry.objects.get(pk=entry["id"]).artist.name})
+
+    def test_skips_unrequested_prefetches(self):
+        self.login(self.admin)
+        with self.assertNumQueries(2):
+            charts = self.client.get("/charts/?fields=id,country.iso2").json()["results"]
+        self.assertEqual(charts[0], {"id": self.chart.pk, "country": {"iso2": "FR"}})
+
+
+class FastReadParityTest(ChartDataMixin, TestCase):
+    """The fast read path must render byte for byte what the serializers render."""
+
+    def assertParity(self, user, url):
+        self.login(user)
+        with self.settings(CHARTFLOW_FAST_READS=False):
+            expected = self.client.get(url)
+        response_cache().clear()
+        with self.settings(CHARTFLOW_FAST_READS=True):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+
+    def test_chart_entries(self):
+        self.assertParity(self.admin, "/chart-entries/")
+        self.assertParity(self.admin, "/chart-entries/?page_size=5")
+
+    def test_charts(self):
+        self.assertParity(self.admin, "/charts/")
+        self.assertParity(self.admin, "/charts/?country=US")
+        self.assertParity(self.admin, "/charts/?page_size=2")
+
+    def test_artists(self):
+        self.assertParity(self.manager, "/artists/")
+        self.assertParity(self.artist_user, "/artists/?page_size=3")
+        self.assertParity(self.admin, "/artists/")
+
+    def test_fast_path_skips_instances(self):
+        self.login(self.admin)
+        with self.settings(CHARTFLOW_FAST_READS=True), self.assertNumQueries(3):
+            self.client.get("/charts/")
+
+
+class FastJSONRendererTest(ChartDataMixin, TestCase):
+    data = {
+        'artist': renderers.fragment({'id': 1, 'name': 'Zoé\u2028', 'manager_name': None, 'nationality': 'FR'}),
+        'ranks': {3: [1.5, None, True]},
+        'tags': ['"', '\x00'],
+    }
+
+    def test_matches_the_stock_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(renderers.FastJSONRenderer().render(self.data), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(self.data), expected)
+
+    def test_honours_the_json_settings(self):
+        for attribute, value in (("ensure_ascii", True), ("compact", False), ("strict", False)):
+            for orjson in (renderers.orjson, None):
+                with mock.patch.object(JSONRenderer, attribute, value), mock.patch.object(renderers, "orjson", orjson):
+                    data = {**self.data, "ratio": float("nan")} if attribute == "strict" else self.data
+                    self.assertEqual(renderers.FastJSONRenderer().render(data), JSONRenderer().render(data), (attribute, orjson))
+        with mock.patch.object(renderers, "orjson", None), self.assertRaises(ValueError):
+            renderers.FastJSONRenderer().render({"ratio": float("nan")})
+
+    def test_spliced_fragments_keep_parity(self):
+        self.login(self.admin)
+        with self.settings(CHARTFLOW_FAST_READS=False):
+            expected = self.client.get("/charts/").content
+        for orjson in (renderers.orjson, None):
+            response_cache().clear()
+            with mock.patch.object(renderers, 'orjson', orjson), \
+                    mock.patch.object(renderers.FastJSONRenderer, 'splice_fragments', True), \
+                    self.settings(CHARTFLOW_FAST_READS=True):
+                self.assertEqual(self.client.get("/charts/").content, expected)
+
+
+class RankMatrixTest(ChartDataMixin, TestCase):
+    def assertBackendParity(self, user, url):
+        self.login(user)
+        with self.settings(CHARTFLOW_ANALYTICS_BACKEND='orm'):
+            expected = self.client.get(url)
+        with self.settings(CHARTFLOW_ANALYTICS_BACKEND='matrix'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+
+    def test_endpoints_match_the_orm_backend(self):
+        # Leave some holes in the charts so that every artist has export potential
+        ChartEntry.objects.filter(chart=self.chart, artist__in=self.artists[1:4]).delete()
+        ChartEntry.objects.filter(chart__country="US", artist__nationality="DE").delete()
+        rebuild_export_potential()
+
+        for artist in self.artists:
+            self.assertBackendParity(self.admin, f"/export-analysis/potential/{artist.pk}/")
+            self.assertBackendParity(self.admin, f"/artists/{artist.pk}/performance/")
+        self.assertBackendParity(self.manager, "/export-analysis/potential/")
+
+    def test_queries(self):
+        matrix = analytics.rank_matrix()
+        self.assertEqual(matrix.best_ranks("US"), {"FR": 4, "US": 4, "DE": 4, "BR": 4})
+        self.assertEqual(matrix.absent_countries(self.artists[1].pk), [])
+        self.assertEqual(matrix.absent_countries(self.artist.pk), ["BR", "DE", "FR", "US"])
+
+    def test_rebuilt_when_the_data_changes(self):
+        matrix = analytics.rank_matrix()
+        self.assertIs(analytics.rank_matrix(), matrix)
+
+        entry = ChartEntry.objects.get(chart=self.chart, artist=self.artists[1])
+        entry.rank = 50
+        entry.save()
+        self.assertEqual(analytics.rank_matrix().artist_entries(self.artists[1].pk)[0], (entry.pk, "FR", 50))
+
+    def test_similar_countries(self):
+        # Brazil only shares the US artists with the other countries
+        ChartEntry.objects.filter(chart__country="BR").exclude(artist__nationality="US").delete()
+
+        self.login(self.manager)
+        response = self.client.get("/countries/FR/similar/?k=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["country"] for row in response.data], ["DE", "US"])
+        self.assertEqual(response.data[0]["similarity"], 1.0)
+        self.assertLess(self.client.get("/countries/FR/similar/").data[-1]["similarity"], 1.0)
+        self.assertEqual(self.client.get("/countries/FR/similar/?k=0").status_code, 400)
+
+        self.login(self.artist_user)
+        self.assertEqual(self.client.get("/countries/FR/similar/").status_code, 403)
+
+
+def per_country_export_potential(artist):
+    """The export potential endpoint's original algorithm, on the current charts,
+    with the countries and artists in the order of the other backends."""
+    charts = Chart.objects.current().exclude(country=artist.nationality).exclude(entries__artist=artist)
+    same_nationality_artists = Artist.objects.filter(nationality=artist.nationality).exclude(id=artist.id)
+    grouped = defaultdict(dict)
+    for entry in ChartEntry.objects.filter(chart__in=charts, artist__in=same_nationality_artists).select_related("chart", "artist"):
+        ranks = grouped[entry.chart.country_id]
+        ranks[entry.artist.name] = min(ranks.get(entry.artist.name, entry.rank), entry.rank)
+    return [
+        {"country": country, "artists": [{"name": name, "rank": rank} for rank, name in sorted((rank, name) for name, rank in ranks.items())]}
+        for country, ranks in sorted(grouped.items())
+    ]
+
+
+class ExportPotentialParityTest(ChartDataMixin, TestCase):
+    """Every export potential backend against the original per-country algorithm."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Leave some holes in the charts so that every artist has export potential
+        ChartEntry.objects.filter(chart=cls.chart, artist__in=cls.artists[1:4]).delete()
+        ChartEntry.objects.filter(chart__country="US", artist__nationality="DE").delete()
+        # There is no British chart, and only the first British artist charts abroad
+        cls.british = Artist.objects.bulk_create([
+            Artist(name=f"Artist GB {i}", nationality="GB", manager=cls.manager) for i in range(2)
+        ])
+        ChartEntry.objects.bulk_create([
+            ChartEntry(chart=chart, artist=cls.british[0], rank=20 + i)
+            for i, chart in enumerate(Chart.objects.filter(country__in=["FR", "US"]).order_by("country"))
+        ])
+        rebuild_export_potential()
+        cls.all_artists = list(Artist.objects.order_by("id"))
+
+    def assertParity(self, export_potential):
+        for artist in self.all_artists:
+            self.assertEqual(export_potential(artist), per_country_export_potential(artist), artist.name)
+
+    def test_fixture(self):
+        # The artist without any foreign entry, and the artist of a nationality without chart
+        self.assertFalse(ChartEntry.objects.filter(artist=self.artist).exists())
+        self.assertFalse(Chart.objects.filter(country="GB").exists())
+        self.assertEqual(
+            per_country_export_potential(self.british[1]),
+            [{"country": "FR", "artists": [{"name": "Artist GB 0", "rank": 20}]}, {"country": "US", "artists": [{"name": "Artist GB 0", "rank": 21}]}],
+        )
+
+    def test_live(self):
+        self.assertParity(exports.live_export_potential)
+
+    def test_stored(self):
+        self.assertParity(exports.stored_export_potential)
+
+    def test_batch(self):
+        batch = exports.batch_export_potential(self.all_artists)
+        self.assertParity(lambda artist: batch[artist.pk])
+
+    def test_matrix(self):
+        matrix = analytics.rank_matrix()
+        self.assertParity(lambda artist: matrix.export_potential(artist.pk, artist.nationality))
+
+
+class ExportPotentialSyncTest(ChartDataMixin, TestCase):
+    """The ExportPotential table follows single row writes through signals."""
+
+    def table(self):
+        return sorted(ExportPotential.objects.values_list("artist_id", "country_id", "nationality", "rank"))
+
+    def assertInSync(self):
+        stored = self.table()
+        rebuild_export_potential()
+        self.assertEqual(stored, self.table())
+
+    def test_chart_entry_save(self):
+        entry = ChartEntry.objects.get(chart=self.chart, artist=self.artists[5])
+        entry.rank = 40
+        entry.save()
+        self.assertInSync()
+        ChartEntry.objects.create(chart=Chart.objects.get(country="US"), artist=self.artist, rank=12)
+        self.assertInSync()
+
+    def test_chart_entry_delete(self):
+        ChartEntry.objects.get(chart=self.chart, artist=self.artists[5]).delete()
+        self.assertInSync()
+
+    def test_nationality_change(self):
+        artist = self.artists[5]
+        artist.nationality = "BR"
+        artist.save()
+        self.assertInSync()
+        self.assertTrue(ExportPotential.objects.filter(artist=artist, nationality="BR").exists())
+
+    def test_suspend_sync(self):
+        entry = ChartEntry.objects.get(chart=self.chart, artist=self.artists[5])
+        with exports.suspend_sync():
+            entry.rank = 40
+            entry.save()
+            self.artists[6].nationality = "BR"
+            self.artists[6].save()
+        self.assertNotEqual(exports.verify_export_potential(), (set(), set()))
+
+        # the receivers are connected again on exit
+        rebuild_export_potential()
+        entry.rank = 41
+        entry.save()
+        self.assertInSync()
+
+    def test_command(self):
+        with exports.suspend_sync():
+            ChartEntry.objects.filter(chart=self.chart, artist=self.artists[5]).update(rank=40)
+            ChartEntry.objects.get(chart=self.chart, artist=self.artists[6]).delete()
+
+        with self.assertRaisesMessage(CommandError, "1 missing rows, 2 unexpected rows"):
+            call_command("exportpotential", "--no-rebuild", "--verify", stdout=StringIO())
+
+        out = StringIO()
+        call_command("exportpotential", "--verify", stdout=out)
+        self.assertIn("matches the live computation", out.getvalue())
+        self.assertInSync()
+
+
+class ClusteringTest(ChartDataMixin, TestCase):
+    def test_kmeans_is_deterministic(self):
+        rng = np.random.default_rng(1)
+        points = np.vstack([rng.normal(0, 0.1, (20, 2)), rng.normal(5, 0.1, (20, 2))])
+        labels, _ = clustering.kmeans(points, 2, seed=3)
+        self.assertEqual(len(set(labels[:20])), 1)
+        self.assertEqual(len(set(labels[20:])), 1)
+        self.assertNotEqual(labels[0], labels[20])
+        self.assertTrue((clustering.kmeans(points, 2, seed=3)[0] == labels).all())
+
+    def test_kmeans_identical_points(self):
+        labels, centroids = clustering.kmeans(np.ones((4, 2)), 2, seed=3)
+        self.assertEqual(len(labels), 4)
+        self.assertTrue((centroids == 1).all())
+
+    def test_cluster_countries(self):
+        # Brazil has no local artist in its chart, unlike the other countries
+        clusters = clustering.cluster_countries()
+        self.assertEqual(clusters, {
+            "BR": CountryCluster.ClusterChoices.POTENTIAL,
+            "DE": CountryCluster.ClusterChoices.MATURE,
+            "FR": CountryCluster.ClusterChoices.MATURE,
+            "US": CountryCluster.ClusterChoices.MATURE,
+        })
+        self.assertEqual(clustering.save_clusters(clusters), (0, 1, 0))
+        self.assertEqual(clustering.save_clusters(clustering.cluster_countries()), (0, 0, 0))
+
+
+class ChartHistoryTest(ChartDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        history.take_snapshots(date(2026, 1, 1))
+        # A week later artists[2] climbs to number one in France and artists[11] drops out
+        ChartEntry.objects.filter(chart=self.chart, artist=self.artists[1]).update(rank=2)
+        ChartEntry.objects.filter(chart=self.chart, artist=self.artists[2]).update(rank=1)
+        ChartEntry.objects.filter(chart=self.chart, artist=self.artists[11]).delete()
+        history.take_snapshots(date(2026, 1, 8))
+
+    def test_snapshots_are_packed(self):
+        snapshot = ChartSnapshot.objects.get(country="FR", date=date(2026, 1, 8))
+        artist_ids, ranks = snapshot.unpack()
+        self.assertEqual(artist_ids[:2].tolist(), [self.artists[2].pk, self.artists[1].pk])
+        self.assertEqual(ranks.tolist(), list(range(1, 11)))
+        self.assertEqual(len(snapshot.artist_ids) + len(snapshot.ranks), 10 * 6)
+
+        # Taking the snapshot again the same day replaces it
+        self.assertEqual(history.take_snapshots(date(2026, 1, 8)), 4)
+        self.assertEqual(ChartSnapshot.objects.count(), 8)
+
+    def test_trajectory(self):
+        self.login(self.manager)
+        response = self.client.get(f"/artists/{self.artists[2].pk}/trajectory/?from=2025-12-01&to=2026-02-01&country=fr")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {"date": "2026-01-01", "country": "FR", "rank": 2},
+            {"date": "2026-01-08", "country": "FR", "rank": 1},
+        ])
+        response = self.client.get(f"/artists/{self.artists[2].pk}/trajectory/?from=2026-01-05&to=2026-02-01")
+        self.assertEqual([row["country"] for row in response.json()], ["BR", "DE", "FR", "US"])
+        self.assertEqual(self.client.get(f"/artists/{self.artists[2].pk}/trajectory/?from=soon").status_code, 400)
+
+        self.login(self.artist_user)
+        self.assertEqual(self.client.get(f"/artists/{self.artists[2].pk}/trajectory/").status_code, 403)
+
+    def test_movers(self):
+        self.login(self.artist_user)
+        response = self.client.get("/charts/movers/?country=FR&from=2026-01-03&to=2026-01-10")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["from"], data["to"]), ("2026-01-01", "2026-01-08"))
+        self.assertEqual(
+            [(mover["artist_id"], mover["from_rank"], mover["to_rank"], mover["change"]) for mover in data["movers"][:3]],
+            [(self.artists[2].pk, 2, 1, 1), (self.artists[1].pk, 1, 2, -1), (self.artists[3].pk, 3, 3, 0)],
+        )
+        self.assertEqual(data["movers"][-1]["artist_id"], self.artists[11].pk)
+        self.assertIsNone(data["movers"][-1]["to_rank"])
+        self.assertEqual(self.client.get("/charts/movers/").status_code, 400)
+
+    def test_retention(self):
+        self.assertEqual(history.prune_snapshots(keep_days=3, today=date(2026, 1, 9)), 4)
+        self.assertEqual(set(ChartSnapshot.objects.values_list("date", flat=True)), {date(2026, 1, 8)})
+
+
+class ChartFilterTest(ChartDataMixin, TestCase):
+    def test_chart_entries(self):
+        self.login(self.admin)
+        response = self.client.get("/chart-entries/?nationality=de&top=2")
+        self.assertEqual(response.status_code, 200)
+        rows = [(row["country"], row["artist"]["id"], row["rank"]) for row in response.data["results"]]
+        # The two best ranked German artists of each chart
+        self.assertEqual(rows, [
+            (country.iso2, artist.pk, rank) for country in self.countries for artist, rank in zip(self.artists[8:10], (8, 9))
+        ])
+        response = self.client.get("/chart-entries/?country=fr&rank_min=3&rank_max=4")
+        self.assertEqual([row["rank"] for row in response.data["results"]], [3, 4])
+
+        self.assertEqual(self.client.get("/chart-entries/?top=0").status_code, 400)
+
+    def test_top_across_pages(self):
+        self.login(self.admin)
+        rows, url = [], "/chart-entries/?top=2&page_size=3"
+        while url:
+            response = self.client.get(url)
+            rows += [(row["country"], row["rank"]) for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(rows, [(country.iso2, rank) for country in self.countries for rank in (1, 2)])
+        self.assertEqual(self.client.get("/chart-entries/?cluster=UNKNOWN").status_code, 400)
+
+    def test_charts(self):
+        CountryCluster.objects.filter(country="BR").update(cluster=CountryCluster.ClusterChoices.POTENTIAL)
+        self.login(self.admin)
+        with self.assertNumQueries(3):
+            response = self.client.get("/charts/?top=3&cluster=Mature")
+        self.assertEqual([chart["country"]["iso2"] for chart in response.data["results"]], ["FR", "US", "DE"])
+        self.assertEqual([[entry["rank"] for entry in chart["entries"]] for chart in response.data["results"]], [[1, 2, 3]] * 3)
+
+        response = self.client.get(f"/charts/{self.chart.pk}/?nationality=US")
+        self.assertEqual([entry["artist"]["nationality"] for entry in response.data["entries"]], ["US"] * 4)
+        self.assertEqual(self.client.get("/charts/?top=x").status_code, 400)
+
+    def test_country_is_case_insensitive(self):
+        self.login(self.admin)
+        response = self.client.get("/charts/?country=fr")
+        self.assertEqual([chart["country"]["iso2"] for chart in response.data["results"]], ["FR"])
+        self.assertEqual(self.client.get("/charts/?country=XX").data["results"], [])
+
+    def test_fast_reads_apply_the_entry_filters(self):
+        self.login(self.admin)
+        url = "/charts/?top=2&nationality=FR&rank_max=9"
+        with self.settings(CHARTFLOW_FAST_READS=False):
+            expected = self.client.get(url)
+        response_cache().clear()
+        with self.settings(CHARTFLOW_FAST_READS=True):
+            self.assertEqual(self.client.get(url).content, expected.content)
+
+
+class ChartSnapshotReadTest(ChartDataMixin, TestCase):
+    """A load publishing between the query on the charts and the one on their entries."""
+
+    @contextmanager
+    def publish_before_entries(self):
+        published = []
+
+        def publish(execute, sql, params, many, context):
+            if not published and 'FROM "chartflow_chartentry"' in sql:
+                published.append(ChartGeneration.objects.create())
+                published[0].publish()
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(publish):
+            yield
+        self.assertTrue(published)
+
+    def assertEntriesListed(self, charts):
+        self.assertEqual(len(charts), len(self.countries))
+        self.assertTrue(all(len(chart["entries"]) == len(self.artists) - 1 for chart in charts))
+
+    def test_list(self):
+        self.login(self.admin)
+        with self.publish_before_entries():
+            self.assertEntriesListed(self.client.get("/charts/").json()["results"])
+
+    def test_fast_list(self):
+        self.login(self.admin)
+        with self.settings(CHARTFLOW_FAST_READS=True), self.publish_before_entries():
+            self.assertEntriesListed(self.client.get("/charts/").json()["results"])
+
+    def test_retrieve(self):
+        self.login(self.admin)
+        with self.publish_before_entries():
+            self.assertEntriesListed([self.client.get(f"/charts/{self.chart.pk}/").json()] * len(self.countries))
+
+    async def test_async_list(self):
+        response = await self.async_client.post("/users/authenticate/", {"email": "admin@gmail.com", "password": "password"})
+        headers = {"Authorization": f"Bearer {response.json()['access']}"}
+        # the wrapper goes on the connection of the thread running the ORM calls
+        publishing = self.publish_before_entries()
+        await sync_to_async(publishing.__enter__)()
+        try:
+            response = await self.async_client.get("/async/charts/", headers=headers)
+        finally:
+            await sync_to_async(publishing.__exit__)(None, None, None)
+        self.assertEntriesListed(response.json()["results"])
+
+
+class StatelessAuthenticationTest(ChartDataMixin, TestCase):
+    def token_login(self, user):
+        response = self.client.post("/users/authenticate/", {"email": user.email, "password": "password"})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return response.data
+
+    def test_claims(self):
+        payload = AccessToken(self.token_login(self.manager)["access"]).payload
+        self.assertEqual(payload["role"], "manager")
+        self.assertEqual(payload["artist_id"], None)
+        self.assertEqual(payload["managed_artist_ids"], [artist.pk for artist in self.artists])
+        self.assertEqual(AccessToken(self.token_login(self.artist_user)["access"])["artist_id"], self.artist.pk)
+
+    def test_no_user_query(self):
+        # Same counts as with force_authenticate, which skips authentication
+        self.token_login(self.artist_user)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(f"/artists/{self.artist.pk}/").status_code, 200)
+        self.assertEqual(self.client.get(f"/artists/{self.artists[1].pk}/").status_code, 403)
+        self.token_login(self.admin)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get("/countries/").status_code, 200)
+
+    def test_fields_missing_from_the_token(self):
+        request = mock.Mock(META={"HTTP_AUTHORIZATION": f"Bearer {self.token_login(self.artist_user)['access']}"})
+        user, _ = authentication.StatelessJWTAuthentication().authenticate(request)
+        self.assertEqual(user, self.artist_user)
+        with self.assertNumQueries(1):
+            self.assertEqual((user.first_name, user.date_joined), (self.artist_user.first_name, self.artist_user.date_joined))
+        # The next requests are served from the user cache
+        user, _ = authentication.StatelessJWTAuthentication().authenticate(request)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.last_name, self.artist_user.last_name)
+
+    def test_refresh_reads_the_claims_again(self):
+        tokens = self.token_login(self.manager)
+        User.objects.filter(pk=self.manager.pk).update(role="admin")
+        response = self.client.post("/token/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(AccessToken(response.data["access"])["role"], "admin")
+
+        User.objects.filter(pk=self.manager.pk).update(is_active=False)
+        response = self.client.post("/token/refresh/", {"refresh": response.data["refresh"]})
+        self.assertEqual(response.status_code, 401)
+
+    def test_tokens_without_claims(self):
+        # Loaded from the database: the user, then its artist profile in the permission check
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.artist_user).access_token}")
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.get(f"/artists/{self.artist.pk}/").status_code, 200)
+
+
+class PermissionScopeTest(ChartDataMixin, TestCase):
+    def test_scope_is_resolved_once_per_request(self):
+        request, view = mock.Mock(user=self.manager, spec=["user"]), mock.Mock(action="retrieve")
+        permission = ArtistViewPermissions()
+        with self.assertNumQueries(1):
+            self.assertTrue(all(permission.has_object_permission(request, view, artist) for artist in self.artists))
+            self.assertEqual(caller_scope(request).managed_artist_ids, {artist.pk for artist in self.artists})
+        other = Artist.objects.create(name="Other", nationality="FR")
+        self.assertFalse(permission.has_object_permission(request, view, other))
+
+    def test_lists_are_scoped(self):
+        other_manager = User.objects.create_user(username="manager2", email="manager2@gmail.com", password="password", role="manager")
+        other = Artist.objects.create(name="Other", nationality="FR", manager=other_manager)
+
+        self.login(self.manager)
+        ids = [artist["id"] for artist in self.client.get("/artists/").data["results"]]
+        self.assertEqual(ids, [artist.pk for artist in self.artists])
+        self.assertEqual(self.client.get(f"/artists/{other.pk}/").status_code, 403)
+        self.assertEqual(set(self.client.get("/export-analysis/potential/").data), {artist.pk for artist in self.artists})
+
+        # Admins see every artist: past the batch size, they must list the ones they want
+        self.login(self.admin)
+        with mock.patch.object(ExportAnalysisViewSet, "max_batch_size", len(self.artists)):
+            self.assertEqual(self.client.get("/export-analysis/potential/").status_code, 400)
+            self.login(self.manager)
+            self.assertEqual(self.client.get("/export-analysis/potential/").status_code, 200)
+
+        self.login(self.artist_user)
+        self.assertEqual([artist["id"] for artist in self.client.get("/artists/").data["results"]], [self.artist.pk])
+        self.assertEqual(self.client.get(f"/artists/{self.artists[1].pk}/performance/").status_code, 403)
+        self.assertEqual(self.client.get(f"/artists/{self.artist.pk}/performance/").status_code, 200)
+
+
+class AsyncLoginTest(ChartDataMixin, TestCase):
+    credentials = {"email": "manager1@gmail.com", "password": "password"}
+
+    async def test_matches_the_sync_login(self):
+        response = await self.async_client.post("/async/users/authenticate/", self.credentials, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        expected = await self.async_client.post("/users/authenticate/", self.credentials)
+        self.assertEqual(response.json()["user"], expected.json()["user"])
+        self.assertEqual(AccessToken(response.json()["access"])["managed_artist_ids"], [artist.pk for artist in self.artists])
+
+        for credentials in ({**self.credentials, "password": "wrong"}, {"email": "nobody@gmail.com", "password": "password"}, {}):
+            response = await self.async_client.post("/async/users/authenticate/", credentials)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), (await self.async_client.post("/users/authenticate/", credentials)).json())
+
+    async def test_non_string_credentials(self):
+        for credentials in ({"email": "unknown@x", "password": 123}, {**self.credentials, "password": ["password"]}, {"email": {}, "password": "password"}):
+            for url in ("/async/users/authenticate/", "/users/authenticate/"):
+                response = await self.async_client.post(url, credentials, content_type="application/json")
+                self.assertEqual((response.status_code, response.json()), (400, {"error": ["Invalid credentials"]}), (url, credentials))
+
+    async def test_back_pressure(self):
+        pool = hashing.HashingPool(workers=1, queue=0)
+        pool.slots.acquire()
+        with mock.patch.object(hashing, "_pool", pool):
+            response = await self.async_client.post("/async/users/authenticate/", self.credentials)
+        self.assertEqual((response.status_code, response["Retry-After"]), (503, "1"))
+
+
+class BlacklistFilterTest(ChartDataMixin, TestCase):
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        keys = [f"jti-{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertLess(sum(f"other-{i}" in bloom for i in range(10000)), 300)
+
+    def test_refresh_checks(self):
+        refresh = self.client.post("/users/authenticate/", {"email": "admin@gmail.com", "password": "password"}).data["refresh"]
+        token = authentication.ScopedRefreshToken(refresh)
+        blacklist_filter.sync()
+        with self.assertNumQueries(0):
+            token.check_blacklist()
+
+        self.assertEqual(self.client.post("/users/logout/", {"refresh": refresh}).status_code, 205)
+        self.assertEqual(self.client.post("/token/refresh/", {"refresh": refresh}).status_code, 401)
+
+    def test_tokens_blacklisted_by_other_workers(self):
+        refresh = RefreshToken.for_user(self.admin)
+        blacklist_filter.sync()
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=refresh["jti"]))
+        with self.settings(CHARTFLOW_BLACKLIST_SYNC_INTERVAL=0):
+            self.assertEqual(self.client.post("/token/refresh/", {"refresh": str(refresh)}).status_code, 401)
+
+
+class AsyncReadViewTest(ChartDataMixin, TestCase):
+    def token(self, user):
+        response = self.client.post("/users/authenticate/", {"email": user.email, "password": "password"})
+        return {"Authorization": f"Bearer {response.data['access']}"}
+
+    async def assertParity(self, headers, url):
+        expected = await self.async_client.get(url, headers=headers)
+        response = await self.async_client.get(f"/async{url}", headers=headers)
+        self.assertEqual(response.status_code, expected.status_code, response.content)
+        expected, data = expected.json(), response.json()
+        if isinstance(data, dict) and "results" in data:
+            # The pagination links point to the async path
+            self.assertEqual(data["results"], expected["results"])
+            self.assertEqual([data["next"] is None, data["previous"] is None], [expected["next"] is None, expected["previous"] is None])
+            return data
+        self.assertEqual(data, expected)
+        return data
+
+    async def test_parity(self):
+        admin = await sync_to_async(self.token)(self.admin)
+        entry = await self.chart.entries.afirst()
+        cluster = await CountryCluster.objects.afirst()
+        for url in [
+            "/countries/", "/countries/FR/", "/countries/XX/",
+            "/country-clusters/", f"/country-clusters/{cluster.pk}/",
+            "/charts/", f"/charts/{self.chart.pk}/", "/charts/?top=3&nationality=US&cluster=MATURE", "/charts/?country=FR", "/charts/?country=fr",
+            "/charts/?top=0", "/charts/?country=XX",
+            "/chart-entries/", f"/chart-entries/{entry.pk}/", "/chart-entries/?country=fr&rank_max=4", "/chart-entries/?top=x",
+            f"/artists/{self.artists[1].pk}/performance/", "/artists/0/performance/",
+            f"/export-analysis/potential/{self.artist.pk}/", "/export-analysis/potential/0/",
+        ]:
+            with self.subTest(url=url):
+                if url == "/artists/0/performance/":
+                    # The sync view fails on unknown artists
+                    self.assertEqual((await self.async_client.get(f"/async{url}", headers=admin)).status_code, 404)
+                else:
+                    await self.assertParity(admin, url)
+
+        with self.settings(CHARTFLOW_ANALYTICS_BACKEND="matrix"):
+            await self.assertParity(admin, f"/artists/{self.artists[1].pk}/performance/")
+            await self.assertParity(admin, f"/export-analysis/potential/{self.artist.pk}/")
+
+    async def test_pages(self):
+        admin = await sync_to_async(self.token)(self.admin)
+        expected = [entry["id"] async for entry in ChartEntry.objects.current().order_by("id").values("id")]
+        ids, url = [], "/async/chart-entries/?page_size=7"
+        while url:
+            data = (await self.async_client.get(url, headers=admin)).json()
+            ids += [entry["id"] for entry in data["results"]]
+            url = data["next"]
+        self.assertEqual(ids, expected)
+        # and back
+        previous = (await self.async_client.get(data["previous"], headers=admin)).json()
+        self.assertEqual([entry["id"] for entry in previous["results"]], expected[-len(data["results"]) - 7:-len(data["results"])])
+
+    async def test_permissions(self):
+        artist, manager = await sync_to_async(self.token)(self.artist_user), await sync_to_async(self.token)(self.manager)
+        self.assertEqual((await self.async_client.get("/async/charts/")).status_code, 401)
+        self.assertEqual((await self.async_client.get("/async/charts/", headers={"Authorization": "Bearer x"})).status_code, 401)
+        self.assertEqual((await self.async_client.get("/async/countries/", headers=artist)).status_code, 403)
+        self.assertEqual((await self.async_client.get("/async/countries/", headers=manager)).status_code, 200)
+        self.assertEqual((await self.async_client.get(f"/async/artists/{self.artist.pk}/performance/", headers=artist)).status_code, 200)
+        self.assertEqual((await self.async_client.get(f"/async/artists/{self.artists[1].pk}/performance/", headers=artist)).status_code, 403)
+        self.assertEqual((await self.async_client.get(f"/async/artists/{self.artists[1].pk}/performance/", headers=manager)).status_code, 200)
+
+
+@contextmanager
+def replica_database(path):
+    """Settings with a replica at `path`, without the warning overriding DATABASES gives."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "Overriding setting DATABASES", UserWarning)
+        with override_settings(DATABASES={**settings.DATABASES, "replica": {"NAME": path}}):
+            yield
+
+
+class ReadReplicaTest(ChartDataMixin, TestCase):
+    def test_router(self):
+        router = ReadReplicaRouter()
+        with replica_database(__file__):
+            self.assertIsNone(router.db_for_read(ChartEntry))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(ChartEntry), "replica")
+                self.assertIsNone(router.db_for_read(User))
+                self.assertEqual(router.db_for_write(ChartEntry), "default")
+        with replica_reads():
+            self.assertIsNone(router.db_for_read(ChartEntry))
+        self.assertFalse(router.allow_migrate("replica", "chartflow"))
+
+    def test_read_endpoints_use_the_replica(self):
+        reads = []
+        self.login(self.admin)
+        with mock.patch.object(ReadReplicaRouter, "db_for_read", autospec=True, side_effect=lambda router, model, **hints: reads.append(
+            (model._meta.model_name, replica._replica_reads.get())
+        )):
+            self.client.get("/charts/")
+            self.client.get(f"/users/{self.admin.pk}/")
+        self.assertIn(("chart", True), reads)
+        self.assertIn(("user", False), reads)
+
+    def test_export_streams_from_the_replica(self):
+        reads = []
+        self.login(self.admin)
+        with mock.patch.object(ReadReplicaRouter, "db_for_read", autospec=True, side_effect=lambda router, model, **hints: reads.append(
+            (model._meta.model_name, replica._replica_reads.get())
+        )):
+            response = self.client.get("/chart-entries/export/")
+            reads.clear()
+            content = b"".join(response.streaming_content)
+        self.assertEqual(len(content.splitlines()), ChartEntry.objects.count())
+        self.assertEqual(set(reads), {("chartentry", True)})
+
+    def test_refresh_refused_in_a_transaction(self):
+        with replica_database("unused.sqlite3"):
+            with self.assertRaises(TransactionManagementError):
+                refresh_replica()
+        self.assertIsNone(refresh_replica())
+
+
+class ReplicaRefreshTest(TransactionTestCase):
+    def test_refresh(self):
+        Country.objects.bulk_create([Country(iso2=iso2, internet_users=90.0, population=1000000) for iso2 in ["FR", "US"]])
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "replica.sqlite3"
+            with replica_database(path):
+                self.assertGreaterEqual(refresh_replica(), 0)
+                Country.objects.filter(iso2="US").delete()
+                refresh_replica()
+            copy = sqlite3.connect(path)
+            try:
+                self.assertEqual(copy.execute("SELECT iso2 FROM chartflow_country").fetchall(), [("FR",)])
+            finally:
+                copy.close()
+
+
+class DatasetMixin:
+    """Small CSV datasets in a temporary directory, read by loaddata."""
+    countries = {"FR": (92.0, 68000000), "US": (91.0, 333000000), "DE": (93.0, 84000000)}
+    artists = [("Aya", "FR"), ("Drake", "CA"), ("Nena", "DE"), ("SZA", "US")]
+    charts = {"FR": ["Aya", "Drake", "SZA"], "US": ["SZA", "Drake"], "DE": ["Nena", "Aya", "Drake"]}
+    clusters = {"FR": 1, "US": 2, "DE": 0}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.datasets = Path(directory.name)
+        patcher = mock.patch.object(loaddata.Command, "datasets_root", f"{self.datasets}/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.write_datasets(self.artists, self.charts)
+
+    def write_datasets(self, artists, charts, ranks=None):
+        """`charts` lists the artist names of each chart by rank, unless `ranks`
+        gives the rank of a (country, name) entry."""
+        ranks = ranks or {}
+        nationalities = dict(artists)
+        pd.DataFrame(
+            [(iso2, iso2, internet_users, population) for iso2, (internet_users, population) in self.countries.items()],
+            columns=["country_iso2", "country_iso3", "%_internet", "population_total"],
+        ).to_csv(self.datasets / "countries.csv")
+        pd.DataFrame(artists, columns=["artistName", "artistCountry"]).to_csv(self.datasets / "artists.csv")
+        pd.DataFrame(
+            [
+                (name, rank, 1, 10, "2025-01-01", 4, 20, iso2, nationalities[name])
+                for iso2, names in charts.items()
+                for rank, name in ((ranks.get((iso2, name), position), name) for position, name in enumerate(names, 1))
+            ],
+            columns=[
+                "artistName", "currentRank", "peakRank", "appearancesOnChart", "peakDate",
+                "consecutiveAppearancesOnChart", "entryRank", "country_iso2", "artistCountry",
+            ],
+        ).to_csv(self.datasets / "charts.csv")
+        pd.DataFrame(self.clusters.items(), columns=["country_iso2", "cluster"]).to_csv(self.datasets / "clusters.csv")
+
+    def load(self, *args) -> str:
+        out = StringIO()
+        call_command("loaddata", *args, stdout=out)
+        return out.getvalue()
+
+    def current_entries(self):
+        return sorted(ChartEntry.objects.current().values_list("chart__country", "artist__name", "rank", "peak_rank", "entry_rank"))
+
+
+class LoadDataTest(DatasetMixin, TestCase):
+    def loaded(self):
+        return {
+            "countries": sorted(Country.objects.values_list("iso2", "internet_users", "population")),
+            "artists": sorted(Artist.objects.values_list("name", "nationality")),
+            "entries": self.current_entries(),
+            "clusters": sorted(CountryCluster.objects.values_list("country", "cluster")),
+        }
+
+    def test_bulk_matches_legacy(self):
+        self.load()
+        bulk = self.loaded()
+        self.assertEqual(len(bulk["countries"]), 3)
+        self.assertEqual(len(bulk["artists"]), 4)
+        self.assertEqual(
+            [(iso2, name, rank) for iso2, name, rank, *_ in bulk["entries"]],
+            sorted((iso2, name, rank) for iso2, names in self.charts.items() for rank, name in enumerate(names, 1)),
+        )
+        self.assertEqual(bulk["clusters"], [("DE", "POTENTIAL"), ("FR", "MATURE"), ("US", "MATURE")])
+
+        self.load("--legacy")
+        self.assertEqual(self.loaded(), bulk)
+        self.assertEqual(ChartGeneration.objects.get().status, ChartGeneration.StatusChoices.CURRENT)
+
+    def test_incremental(self):
+        self.load()
+        before = dict(((iso2, name), entry_id) for entry_id, iso2, name in ChartEntry.objects.current().values_list("id", "chart__country", "artist__name"))
+
+        # Nena is renamed, Drake moves down the US chart and leaves the German one
+        artists = [("Aya", "FR"), ("Drake", "CA"), ("Nena K", "DE"), ("SZA", "US")]
+        charts = {"FR": ["Aya", "Drake", "SZA"], "US": ["SZA", "Drake"], "DE": ["Nena K", "Aya"]}
+        self.write_datasets(artists, charts, ranks={("US", "Drake"): 5})
+        out = self.load("--incremental")
+
+        self.assertIn("artists        +1 ~0 -1", out)
+        # Nena's entry goes with her, before the chart entries are diffed
+        self.assertIn("chart entries  +1 ~1 -1", out)
+        self.assertIn("countries      +0 ~0 -0", out)
+        self.assertIn("clusters       +0 ~0 -0", out)
+        after = dict(((iso2, name), entry_id) for entry_id, iso2, name in ChartEntry.objects.current().values_list("id", "chart__country", "artist__name"))
+        # The entries kept are updated in place, the removed ones are gone
+        self.assertEqual({key: after[key] for key in before.keys() & after.keys()}, {key: before[key] for key in before.keys() & after.keys()})
+        self.assertEqual(before.keys() - after.keys(), {("DE", "Nena"), ("DE", "Drake")})
+        self.assertEqual(after.keys() - before.keys(), {("DE", "Nena K")})
+        self.assertEqual(ChartEntry.objects.get(pk=after[("US", "Drake")]).rank, 5)
+        self.assertFalse(Artist.objects.filter(name="Nena").exists())
+        self.assertEqual(ChartGeneration.objects.count(), 1)
+
+    def test_staged_generation_is_hidden_until_published(self):
+        self.load()
+        published = ChartGeneration.current()
+        staged = ChartGeneration.objects.create()
+        chart = Chart.objects.create(country_id="FR", generation=staged)
+        ChartEntry.objects.create(chart=chart, artist=Artist.objects.get(name="SZA"), rank=1)
+
+        self.assertEqual(set(Chart.objects.current().values_list("generation", flat=True)), {published.pk})
+        self.assertFalse(ChartEntry.objects.current().filter(chart=chart).exists())
+
+        staged.publish()
+        published.refresh_from_db()
+        self.assertEqual(published.status, ChartGeneration.StatusChoices.RETIRED)
+        self.assertEqual(list(Chart.objects.current()), [chart])
+        self.assertEqual(list(ChartEntry.objects.current().values_list("artist__name", "rank")), [("SZA", 1)])
+
+    def test_keep_generations(self):
+        for _ in range(3):
+            self.load("--keep-generations", "1")
+        statuses = list(ChartGeneration.objects.order_by("id").values_list("status", flat=True))
+        self.assertEqual(statuses, [ChartGeneration.StatusChoices.RETIRED, ChartGeneration.StatusChoices.CURRENT])
+        self.assertEqual(len(self.current_entries()), 8)
+
+        self.load()
+        self.assertEqual(list(ChartGeneration.objects.values_list("status", flat=True)), [ChartGeneration.StatusChoices.CURRENT])
+        self.assertEqual(Chart.objects.count(), len(self.countries))
+
+    def test_export_potential_is_published_with_the_charts(self):
+        self.load()
+        published, stored = ChartGeneration.current(), sorted(ExportPotential.objects.values_list("artist__name", "country", "rank"))
+        self.write_datasets(self.artists, {**self.charts, "US": ["Drake", "SZA"]})
+
+        # A failed rebuild takes the publication back with it
+        with mock.patch.object(exports, "rebuild_export_potential", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.load()
+        self.assertEqual(ChartGeneration.current(), published)
+        self.assertEqual(sorted(ExportPotential.objects.values_list("artist__name", "country", "rank")), stored)
+
+        self.load()
+        self.assertEqual(exports.verify_export_potential(), (set(), set()))
+        self.assertIn(("Drake", "US", 1), ExportPotential.objects.values_list("artist__name", "country", "rank"))
+
+    def test_legacy_load_publishes_complete_charts(self):
+        publish = ChartGeneration.publish
+        entries_at_publish = []
+
+        def record(generation):
+            entries_at_publish.append(ChartEntry.objects.filter(chart__generation=generation).count())
+            publish(generation)
+
+        with mock.patch.object(ChartGeneration, "publish", autospec=True, side_effect=record):
+            self.load("--legacy")
+        self.assertEqual(entries_at_publish, [8])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CreateUsersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Artist.objects.bulk_create([Artist(name=f"Artist {i}", nationality="FR") for i in range(12)])
+
+    def create_users(self, *args):
+        call_command("createusers", "--managers", "3", "--max-artists", "4", *args, stdout=StringIO())
+        return (
+            sorted(User.objects.values_list("username", "email", "role", "is_staff")),
+            sorted(Artist.objects.values_list("id", "manager__username", "user__username")),
+        )
+
+    def test_seeded_runs_match(self):
+        users, artists = self.create_users("--seed", "7")
+        self.assertEqual(self.create_users("--seed", "7", "--legacy"), (users, artists))
+        self.assertEqual(self.create_users("--seed", "7"), (users, artists))
+
+        self.assertEqual([role for *_, role, _ in users].count("manager"), 3)
+        self.assertIn(("admin", "admin@gmail.com", "admin", True), users)
+        linked = [(manager, user) for _, manager, user in artists if manager is not None]
+        self.assertTrue(linked)
+        self.assertEqual([role for *_, role, _ in users].count("artist"), len(linked))
+        for manager in ("manager1", "manager2", "manager3"):
+            managed = [user for owner, user in linked if owner == manager]
+            self.assertLessEqual(len(managed), 4)
+            self.assertEqual(sorted(managed), [f"artist.{manager[7:]}.{x + 1}" for x in range(len(managed))])
+        self.assertTrue(User.objects.get(username="manager1").check_password("password"))
+
+
+class ChartEntryExportTest(ChartDataMixin, TestCase):
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_filters(self):
+        self.login(self.admin)
+        rows = [json.loads(line) for line in self.export("/chart-entries/export/?country=fr&top=2").splitlines()]
+        self.assertEqual([(row["country"], row["rank"], row["artist_id"]) for row in rows], [("FR", 1, self.artists[1].pk), ("FR", 2, self.artists[2].pk)])
+
+        lines = self.export("/chart-entries/export/?output=csv&nationality=de&rank_max=8&cluster=mature").splitlines()
+        self.assertEqual(lines[0], "id,country,rank,artist_id,artist_name,artist_nationality")
+        self.assertEqual([line.split(",")[1:3] for line in lines[1:]], [[country.iso2, "8"] for country in self.countries])
+
+        # The list and the export read the same filters
+        listed = self.client.get("/chart-entries/?nationality=US&top=3&page_size=100").data["results"]
+        exported = [json.loads(line) for line in self.export("/chart-entries/export/?nationality=US&top=3").splitlines()]
+        self.assertEqual([row["id"] for row in exported], [row["id"] for row in listed])
+
+    def test_invalid_params(self):
+        self.login(self.admin)
+        for params in ("cluster=UNKNOWN", "top=0", "rank_min=x", "output=xml"):
+            self.assertEqual(self.client.get(f"/chart-entries/export/?{params}").status_code, 400, params)
+
+    def test_permissions(self):
+        self.assertEqual(self.client.get("/chart-entries/export/").status_code, 401)
+        self.login(self.artist_user)
+        self.assertEqual(len(self.export("/chart-entries/export/").splitlines()), ChartEntry.objects.count())
@@ -2,9 +2,10 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, ArtistViewSet, CountryViewSet, ChartViewSet,
-    ChartEntryViewSet, CountryClusterViewSet, ExportAnalysisViewSet
+    ChartEntryViewSet, CountryClusterViewSet, ExportAnalysisViewSet, CacheStatsViewSet
 )
 from rest_framework_simplejwt.views import TokenRefreshView
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -14,7 +15,20 @@ router.register(r'charts', ChartViewSet)
 router.register(r'chart-entries', ChartEntryViewSet)
 router.register(r'country-clusters', CountryClusterViewSet)
 router.register(r'export-analysis', ExportAnalysisViewSet, basename='export-analysis')
+router.register(r'cache-stats', CacheStatsViewSet, basename='cache-stats')
 urlpatterns = [
     path('', include(router.urls)),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('async/users/authenticate/', async_views.authenticate, name='async_authenticate'),
+    # Async twins of the read endpoints, for ASGI deployments
+    path('async/countries/', async_views.CountryView.as_view()),
+    path('async/countries/<str:pk>/', async_views.CountryView.as_view()),
+    path('async/country-clusters/', async_views.CountryClusterView.as_view()),
+    path('async/country-clusters/<int:pk>/', async_views.CountryClusterView.as_view()),
+    path('async/charts/', async_views.ChartView.as_view()),
+    path('async/charts/<int:pk>/', async_views.ChartView.as_view()),
+    path('async/chart-entries/', async_views.ChartEntryView.as_view()),
+    path('async/chart-entries/<int:pk>/', async_views.ChartEntryView.as_view()),
+    path('async/artists/<int:pk>/performance/', async_views.ArtistPerformanceView.as_view()),
+    path('async/export-analysis/potential/<int:pk>/', async_views.ExportPotentialView.as_view()),
 ]
\ No newline at end of file
@@ -1,4 +1,6 @@
-from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Prefetch
 from django.forms import ValidationError
 from rest_framework import viewsets
 from rest_framework.decorators import action
@@ -6,18 +8,65 @@ from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthentica
 from rest_framework.response import Response
 from rest_framework import status
 
-from chartflow.permissions import ArtistViewPermissions, ChartEntryViewPermissions, ChartViewPermissions, CountryClusterViewPermissions, CountryViewPermissions, UserViewPermissions
+from chartflow.analytics import matrix_backend, rank_matrix
+from chartflow.authentication import ScopedRefreshToken, login_payload
+from chartflow import history
+from chartflow.cache import CachedResponseMixin, UserScopedConditionalGetMixin, cache_stats
+from chartflow.exports import batch_export_potential, stored_export_potential
+from chartflow.filters import ChartEntryFilter, ChartFilter, EntryFilter
+from chartflow.pagination import IdCursorPagination
+from chartflow.permissions import scope_artists, ArtistViewPermissions, ChartEntryViewPermissions, ChartViewPermissions, CountryClusterViewPermissions, CountryViewPermissions, UserViewPermissions
+from chartflow.replica import ReplicaReadMixin
+from chartflow.readers import ArtistReader, ChartEntryReader, ChartReader, FastReadMixin, artist as artist_data, fast_reads_enabled, read_snapshot
+from chartflow.streaming import stream_entries
 from .models import User, Artist, Country, Chart, ChartEntry, CountryCluster
 from .serializers import (
-    AdminArtistSerializer, UserSerializer, ArtistSerializer, CountrySerializer, 
+    SparseFieldsetMixin, AdminArtistSerializer, UserSerializer, ArtistSerializer, CountrySerializer, 
     ChartSerializer, ChartEntrySerializer, CountryClusterSerializer
 )
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.tokens import TokenError
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+
+
+def date_param(request, name, default):
+    if (value := request.query_params.get(name)) is None:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+class SparseFieldsetViewMixin:
+    """Narrows the queryset of `list` and `retrieve` to the columns and joins
+    needed by the fields requested with `?fields=`.
+
+    `prefetches` maps nested fields to the lookups they need prefetched;
+    they only run when that field is rendered as a nested object."""
+    prefetches = {}
+
+    def get_prefetches(self) -> dict:
+        return self.prefetches
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ("list", "retrieve") or not issubclass(self.get_serializer_class(), SparseFieldsetMixin):
+            return queryset
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+        only, related, nested = self.get_serializer().get_query_plan()
+        if self.request.query_params.get('fields'):
+            queryset = queryset.select_related(None)
+            if related:
+                queryset = queryset.select_related(*related)
+            if only is not None:
+                queryset = queryset.only(*only)
+        prefetches = self.get_prefetches()
+        return queryset.prefetch_related(*[lookup for name in nested for lookup in prefetches.get(name, ())])
+
+
+class UserViewSet(UserScopedConditionalGetMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
+    queryset = User.objects.select_related('artist_profile__manager')
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated, IsAdminUser|UserViewPermissions)
 
@@ -25,7 +74,7 @@ class UserViewSet(viewsets.ModelViewSet):
     def logout(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = ScopedRefreshToken(refresh_token)
             token.blacklist()
             return Response({}, status=status.HTTP_205_RESET_CONTENT)
         except KeyError:
@@ -36,14 +85,12 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'], permission_classes=())
     def authenticate(self, request):
         try:
-            user = User.objects.filter(email=request.data.get('email')).first()
-            if user and user.check_password(request.data.get('password')):
-                refresh = RefreshToken.for_user(user)
-                return Response({
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
-                    'user': UserSerializer(user).data
-                })
+            email, password = request.data.get('email'), request.data.get('password')
+            if not isinstance(email, str) or not isinstance(password, str):
+                raise ValidationError("Invalid credentials")
+            user = User.objects.filter(email=email).first()
+            if user and user.check_password(password):
+                return Response(login_payload(user))
             else:
                 raise ValidationError("Invalid credentials")
         except ValidationError as e:
@@ -52,27 +99,49 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def me(self, request):
         try:
-            user = UserSerializer(request.user)
+            user = UserSerializer(self.get_queryset().get(pk=request.user.pk))
             return Response(user.data)
         except ValidationError as e:
             return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ArtistViewSet(viewsets.ModelViewSet):
-    queryset = Artist.objects.all()
+class ArtistViewSet(UserScopedConditionalGetMixin, SparseFieldsetViewMixin, FastReadMixin, viewsets.ModelViewSet):
+    # AdminArtistSerializer nests whole users, it always goes through the serializer
+    reader = ArtistReader()
+    queryset = Artist.objects.select_related('manager', 'user')
     serializer_class = ArtistSerializer
+    pagination_class = IdCursorPagination
+    # AdminArtistSerializer (depth=1) nests the full user and manager, including their m2m fields
+    prefetches = {
+        'user': ['user__groups', 'user__user_permissions'],
+        'manager': ['manager__groups', 'manager__user_permissions'],
+    }
     permission_classes = (IsAuthenticated, IsAdminUser|ArtistViewPermissions)
     
     def list(self, request, *args, **kwargs):
-        queryset = self.queryset
-        if request.user.role in ["manager"]:
-            queryset = queryset.filter(manager=request.user)
-            
-        if request.user.role in ["admin"]:
-            self.serializer_class = AdminArtistSerializer
-
-        serializer = self.get_serializer(queryset.all(), many=True)
-        return Response(serializer.data)
+        return self.conditional_response(self.list_artists, request, *args, **kwargs)
+
+    def get_serializer_class(self):
+        if self.action == "list" and getattr(self.request.user, "role", None) in ["admin"]:
+            return AdminArtistSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        # Detail routes answer 403 rather than 404 out of scope, see ArtistViewPermissions
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = scope_artists(self.request, queryset)
+        return queryset
+
+    def list_artists(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        if fast_reads_enabled(request) and self.get_serializer_class() is ArtistSerializer:
+            data, _ = self.fast_list(queryset)
+            return self.get_paginated_response(data)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=["get"])
     def nationalities(self,request):
@@ -81,7 +150,7 @@ class ArtistViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def me(self,request):
         try:
-            artist = ArtistSerializer(request.user.artist_profile)
+            artist = ArtistSerializer(self.get_queryset().get(user=request.user))
             return Response(artist.data)
         except ValidationError as e:
             return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
@@ -92,71 +161,186 @@ class ArtistViewSet(viewsets.ModelViewSet):
     def performance(self, request, pk):
         try:
             pass
+            if matrix_backend():
+                artist = Artist.objects.select_related('manager').get(id=pk)
+                self.check_object_permissions(request, artist)
+                data = artist_data(artist.pk, artist.name, artist.manager.username if artist.manager else None, artist.nationality)
+                # Same payload as ChartEntrySerializer
+                return Response([
+                    {'id': entry_id, 'artist': data, 'rank': rank, 'country': country}
+                    for entry_id, country, rank in rank_matrix().artist_entries(artist.pk)
+                ])
             artist = Artist.objects.get(id=pk)
-            chart_entries = ChartEntry.objects.filter(artist=artist)
+            self.check_object_permissions(request, artist)
+            chart_entries = ChartEntry.objects.current().filter(artist=artist).select_related('artist__manager', 'chart__country')
             return Response(ChartEntrySerializer(chart_entries, many=True).data)
         except ValidationError as e:
             return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'])
+    def trajectory(self, request, pk=None):
+        """Rank of the artist in the chart snapshots between `?from=` and `?to=`
+        (the last year by default), optionally in one `?country=`."""
+        try:
+            artist = self.get_object()
+            end = date_param(request, 'to', date.today())
+            start = date_param(request, 'from', end - timedelta(days=365))
+            country = request.query_params.get('country', '').upper() or None
+            return Response(history.artist_trajectory(artist.pk, start, end, country))
+        except ValidationError as e:
+            return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
+
 
-class CountryViewSet(viewsets.ModelViewSet):
+class CountryViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
     permission_classes = (IsAuthenticated, IsAdminUser|CountryViewPermissions)
+    max_similar = 50
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """The `?k=` (default 5) countries whose current charts overlap the most with this one's."""
+        try:
+            country = self.get_object()
+            try:
+                k = int(request.query_params.get('k', 5))
+            except ValueError:
+                raise ValidationError("k must be an integer")
+            if not 1 <= k <= self.max_similar:
+                raise ValidationError(f"k must be between 1 and {self.max_similar}")
+            return Response(rank_matrix().similar_countries(country.iso2, k))
+        except ValidationError as e:
+            return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ChartViewSet(viewsets.ModelViewSet):
-    queryset = Chart.objects.all()
+class ChartViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, FastReadMixin, viewsets.ModelViewSet):
+    reader = ChartReader()
+    queryset = Chart.objects.current().select_related('country')
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['country']
+    filterset_class = ChartFilter
     serializer_class = ChartSerializer
+    pagination_class = IdCursorPagination
     permission_classes = (IsAuthenticated, IsAdminUser|ChartViewPermissions)
 
+    def list(self, request, *args, **kwargs):
+        # The charts and their entries come from the same snapshot
+        with read_snapshot(Chart):
+            return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        with read_snapshot(Chart):
+            return super().retrieve(request, *args, **kwargs)
+
+    def get_entries(self):
+        """Entries listed in each chart, narrowed by the EntryFilter params.
+        They are selected by chart id only: the charts read are the current
+        ones, even if a new generation was published since."""
+        filterset = EntryFilter(self.request.query_params, queryset=ChartEntry.objects.order_by('id'))
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset.qs
+
+    def get_prefetches(self):
+        # Prefetched entries get their `chart` cache set to the parent chart, so
+        # `get_country` reuses the chart's selected country
+        return {'entries': [Prefetch('entries', queryset=self.get_entries().select_related('artist__manager'))]}
+
+    def shape(self, rows):
+        return self.reader.shape(rows, entries=self.get_entries())
+
     @action(detail=False, methods=['get'], url_path='countries')
     def countries(self, request, country_iso2=None):
         try:
-            countries = Chart.objects.values('country').distinct()
+            countries = Chart.objects.current().values('country').distinct()
             countries = [country["country"] for country in countries]
             return Response({'countries': countries}, status=status.HTTP_200_OK)
         except ValidationError as e:
             return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def movers(self, request):
+        """Rank changes in the `?country=` chart between its snapshots on `?from=`
+        and `?to=` (the last week by default)."""
+        try:
+            if not (country := request.query_params.get('country', '').upper()):
+                raise ValidationError("country is required")
+            end = date_param(request, 'to', date.today())
+            start = date_param(request, 'from', end - timedelta(days=7))
+            return Response(history.chart_movers(country, start, end))
+        except ValidationError as e:
+            return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
+
 
-class ChartEntryViewSet(viewsets.ModelViewSet):
-    queryset = ChartEntry.objects.all()
+class ChartEntryViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, FastReadMixin, viewsets.ModelViewSet):
+    reader = ChartEntryReader()
+    queryset = ChartEntry.objects.current().select_related('artist__manager', 'chart__country')
+    filterset_class = ChartEntryFilter
     serializer_class = ChartEntrySerializer
+    pagination_class = IdCursorPagination
     permission_classes = (IsAuthenticated, IsAdminUser|ChartEntryViewPermissions)
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Streams every current chart entry as JSON Lines (default) or CSV (`?output=csv`),
+        filtered like the list (ChartEntryFilter)."""
+        filterset = ChartEntryFilter(request.query_params, queryset=ChartEntry.objects.current(), request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        try:
+            return stream_entries(filterset.qs, request.query_params.get('output', 'jsonl'))
+        except ValidationError as e:
+            return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
+
 
-class CountryClusterViewSet(viewsets.ModelViewSet):
-    queryset = CountryCluster.objects.all()
+class CountryClusterViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
+    queryset = CountryCluster.objects.select_related('country')
     serializer_class = CountryClusterSerializer
     permission_classes = (IsAuthenticated, IsAdminUser|CountryClusterViewPermissions)
 
 
-class ExportAnalysisViewSet(viewsets.ViewSet):
+class CacheStatsViewSet(viewsets.ViewSet):
+    permission_classes = (IsAuthenticated, IsAdminUser)
+
+    def list(self, request):
+        return Response(cache_stats())
+
+
+class ExportAnalysisViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    max_batch_size = 200
+
+    @action(detail=False, methods=['get'], url_path='potential')
+    def batch_export_potential(self, request):
+        """Export potential of several artists, keyed by artist id: the ids
+        given in `?artists=1,2,3`, or else every artist in the caller's scope,
+        as long as there are at most max_batch_size of them."""
+        try:
+            if artist_ids := request.query_params.get('artists'):
+                try:
+                    artist_ids = {int(artist_id) for artist_id in artist_ids.split(',')}
+                except ValueError:
+                    raise ValidationError("Artist ids must be integers")
+                if len(artist_ids) > self.max_batch_size:
+                    raise ValidationError(f"At most {self.max_batch_size} artists per request")
+                artists = list(Artist.objects.filter(id__in=artist_ids))
+                if len(artists) != len(artist_ids):
+                    raise ValidationError("Artist not found")
+            else:
+                artists = list(scope_artists(request, Artist.objects.order_by('id'))[:self.max_batch_size + 1])
+                if len(artists) > self.max_batch_size:
+                    raise ValidationError(f"More than {self.max_batch_size} artists in scope, list them with ?artists=")
+            if matrix_backend():
+                matrix = rank_matrix()
+                return Response({artist.pk: matrix.export_potential(artist.pk, artist.nationality) for artist in artists})
+            return Response(batch_export_potential(artists))
+        except ValidationError as e:
+            return Response({'error': e}, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'], url_path='potential/(?P<artist_id>\d+)')
     def export_potential(self, request, artist_id=None):
         try:
             artist = Artist.objects.get(id=artist_id)
-            nationality = artist.nationality
-            foreign_charts_not_present_in = Chart.objects.exclude(country=nationality).exclude(entries__artist=artist)
-            same_nationality_artists = Artist.objects.filter(nationality=nationality).exclude(id=artist_id)
-            foreign_entries = ChartEntry.objects.filter(
-                chart__in=foreign_charts_not_present_in,
-                artist__in=same_nationality_artists
-            )
-
-            grouped = defaultdict(lambda: defaultdict(lambda: {"name": "", "rank": 200}))
-            for entry in foreign_entries:
-                country = entry.chart.country.iso2
-                name = entry.artist.name
-                rank = entry.rank
-                artist_info = grouped[country][name]
-                artist_info.update({"name": name, "rank": min(artist_info["rank"], rank)})
-
-            result = [{"country": country, "artists": list(artists.values())} for country, artists in grouped.items()]
-            
-            return Response(result)
+            if matrix_backend():
+                return Response(rank_matrix().export_potential(artist.pk, artist.nationality))
+            return Response(stored_export_potential(artist))
         except Artist.DoesNotExist:
             return Response({'error': ValidationError("Artist not found")}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'chartflow.middleware.ThresholdGZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,15 +83,112 @@ WSGI_APPLICATION = 'ddd_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connection settings of the SQLite databases: 'default' for Django's own, or
+# 'performance'. The performance profile switches the database file to WAL,
+# so it is opted into per deployment rather than applied to the committed
+# db.sqlite3.
+SQLITE_PROFILE = os.environ.get('CHARTFLOW_SQLITE_PROFILE', 'default')
+
+SQLITE_PROFILES = {
+    'default': {},
+    'performance': {
+        # Under WSGI, connections are kept 10 minutes between requests and checked
+        # before being reused. Deployments served through ASGI should set
+        # CHARTFLOW_CONN_MAX_AGE=0: the async views run their queries on executor
+        # threads, where Django never closes persistent connections, and opening
+        # a SQLite file is cheap.
+        'CONN_MAX_AGE': int(os.environ.get('CHARTFLOW_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL lets readers go on while a writer commits; with WAL, synchronous=NORMAL
+            # only gives up the last commits on an OS crash, not on a process crash.
+            # 256 MB of the file are memory-mapped, 64 MB of pages cached per connection.
+            'init_command': (
+                'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; '
+                'PRAGMA mmap_size=268435456; PRAGMA cache_size=-65536; PRAGMA temp_store=MEMORY'
+            ),
+            # Writers take the write lock when their transaction begins, waiting up to
+            # `timeout` seconds for it, rather than failing to upgrade a read lock
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    },
+}
+
+# Copy of the database the chart read endpoints are served from, refreshed
+# after every load (chartflow.replica); unset reads everything from the primary
+SQLITE_READ_REPLICA = os.environ.get('CHARTFLOW_SQLITE_READ_REPLICA') or None
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **SQLITE_PROFILES[SQLITE_PROFILE],
     }
 }
 
+if SQLITE_READ_REPLICA:
+    profile = SQLITE_PROFILES[SQLITE_PROFILE]
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_READ_REPLICA,
+        **profile,
+        'OPTIONS': {
+            # The journal mode comes with the copy, and nothing but the refresh writes to it
+            'init_command': 'PRAGMA query_only=ON; PRAGMA mmap_size=268435456; PRAGMA cache_size=-65536',
+            'timeout': profile.get('OPTIONS', {}).get('timeout', 5),
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['chartflow.replica.ReadReplicaRouter']
+
 AUTH_USER_MODEL = "chartflow.User"
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Serialized API responses, invalidated through chartflow.models.DataVersion.
+    # Switch to FileBasedCache to share it between worker processes.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chartflow-responses',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+CHARTFLOW_RESPONSE_CACHE = 'responses'
+
+# Serve the chart, chart entry and artist lists through chartflow.readers
+# (values() projections) instead of the serializers
+CHARTFLOW_FAST_READS = False
+
+# Backend of the export potential and artist performance endpoints: 'orm'
+# (queries) or 'matrix' (the in-process rank matrix of chartflow.analytics)
+CHARTFLOW_ANALYTICS_BACKEND = 'orm'
+
+# Seconds a user loaded for a field missing from its token is kept in process
+CHARTFLOW_USER_CACHE_TTL = 60
+
+# Password hashing threads of the async login view (CPU count by default), and
+# logins waiting for one before new ones get a 503
+CHARTFLOW_LOGIN_WORKERS = None
+CHARTFLOW_LOGIN_QUEUE = 64
+
+# Seconds a token blacklisted by another worker may still be refreshed here
+CHARTFLOW_BLACKLIST_SYNC_INTERVAL = 5
+
+# Responses smaller than this are sent uncompressed
+CHARTFLOW_GZIP_MIN_LENGTH = 1024
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -134,13 +233,20 @@ STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
+    # Builds request.user from the access token claims, without a query;
+    # 'rest_framework_simplejwt.authentication.JWTAuthentication' loads it from the database
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'chartflow.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # Uses orjson when installed; 'rest_framework.renderers.JSONRenderer' is the stock equivalent
+    'DEFAULT_RENDERER_CLASSES': [
+        'chartflow.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
@@ -153,6 +259,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'BLACKLIST_AFTER_ROTATION': True,
     'ROTATE_REFRESH_TOKENS': True,
+    # Access tokens carry the role and scope claims read by the permissions
+    'TOKEN_REFRESH_SERIALIZER': 'chartflow.authentication.ScopedTokenRefreshSerializer',
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file